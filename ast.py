@@ -2,6 +2,8 @@
 
 from pratt import prefix, infix, infix_r, postfix, brackets, \
   subscript, nullary, ifelse, symap, parse as pratt_parse, expr
+from weakref import ref
+from copy import deepcopy
 from log import Log
 log = Log('ast')
 
@@ -153,6 +155,9 @@ class Plus(Unary): pass
 @prefix('match', 1)
 class Match(Node): pass
 
+@prefix('memo ', 2)
+class Memo(Unary): pass
+
 @prefix('->', 1)
 class Lambda0(Unary): pass
 
@@ -244,19 +249,128 @@ class IfElse(Node):
 # AST TRANSFORMATIONS #
 #######################
 
-def rewrite(tree, f, d=0, **kwargs):
-  """ Generic function to transform AST. It reqursively
-      applies function to all elements of the tree.
+def visits(*types, skip=()):
+  """ Declares which nodes a rewrite function is interested in.
+      The function is not called for nodes of other types and
+      subtrees of nodes from skip are not traversed.
+  """
+  def decorator(f):
+    f.types = types
+    f.skip = skip
+    return f
+  return decorator
+
+
+def rewrite(tree, f, **kwargs):
+  """ Generic function to transform AST. It applies function to
+      all elements of the tree: to the root first and then to
+      children of every node after the children of that child
+      are transformed. It uses an explicit stack, so the depth
+      of the tree is not limited by the recursion limit. New
+      nodes get positions of the nodes they replace.
   """
-  if d==0: tree = f(tree, d, **kwargs)  # TODO: is this a dirty hack?
-  for i,n in enumerate(tree):
-      if isinstance(n, Node):
-        n = rewrite(n, f, d+1, **kwargs)
-      tree[i] = f(n, d, **kwargs)
+  types = getattr(f, 'types', None) or (object,)
+  skip = getattr(f, 'skip', ())
+  if isinstance(tree, types):
+    tree = inherit(f(tree, 0, **kwargs), tree)  # TODO: is this a dirty hack?
+  if not isinstance(tree, Node) or isinstance(tree, skip):
+    return tree
+  stack = [[tree, 0, 0]]  # node, index of the next child, depth
+  while stack:
+    top = stack[-1]
+    node, i, d = top
+    if i < len(node):
+      top[1] = i + 1
+      n = node[i]
+      if isinstance(n, Node) and not isinstance(n, skip):
+        stack.append([n, 0, d+1])
+      elif isinstance(n, types):
+        node[i] = inherit(f(n, d, **kwargs), n)
+      continue
+    stack.pop()
+    if stack and isinstance(node, types):
+      parent, i, d = stack[-1]
+      parent[i-1] = inherit(f(node, d, **kwargs), node)
   return tree
 
 
+def walk(tree):
+  """ Iterates over all nodes and leafs of the tree (depth-first). """
+  stack = [tree]
+  while stack:
+    node = stack.pop()
+    yield node
+    if isinstance(node, Node):
+      stack.extend(reversed(node))
+
+
+#############
+# POSITIONS #
+#############
+
+# Source positions are kept in a side table (id of a node -> weak
+# reference to it, line, column) instead of attributes, so nodes
+# stay the same and the interpreter does not pay for them. Entries
+# are removed when their nodes are gone (e.g., trees of earlier
+# runs with --watch).
+positions = {}
+
+class Location(ref):
+  __slots__ = ['key']
+
+def forget(location):
+  entry = positions.get(location.key)
+  if entry and entry[0] is location:
+    del positions[location.key]
+
+def locate(node, line, col):
+  location = Location(node, forget)
+  location.key = id(node)
+  positions[location.key] = (location, line, col)
+
+
+def position(node):
+  """ Returns (line, column) of the node or None. """
+  entry = positions.get(id(node))
+  if entry and entry[0]() is node:
+    return entry[1:]
+
+
+def inherit(new, old):
+  """ Gives the new node the position of the old one. """
+  if new is not old and position(new) is None:
+    pos = position(old)
+    if pos:
+      locate(new, *pos)
+  return new
+
+
+def clone(tree, shift=0):
+  """ Deep copy of the tree with positions, shift is added to lines. """
+  copy = deepcopy(tree)
+  for old, new in zip(walk(tree), walk(copy)):
+    pos = position(old)
+    if pos:
+      locate(new, pos[0] + shift, pos[1])
+  return copy
+
+
+@visits(Node)
+def locate_children(node, depth):
+  """ Nodes made of tokens (e.g., by the Pratt parser) get the
+      position of their first child.
+  """
+  if position(node) is None:
+    for child in node:
+      pos = position(child)
+      if pos:
+        locate(node, *pos)
+        break
+  return node
+
+
 @rewrites
+@visits(Expr)
 def implicit_calls(expr, depth):
   """ Adds "implicit" calls. E.g., expression "a b c" will
       be parsed as "a(b(c))". This is done by inserting
@@ -270,14 +384,15 @@ def implicit_calls(expr, depth):
   prev, nxt = None, None
   for i,nxt in enumerate(expr):
     if isinstance(prev, Id) and \
-    (isinstance(nxt, (Int,Id)) or nxt.sym =='('):
-      result.append(symap['@']())
+    (isinstance(nxt, (Int,Id,Str)) or getattr(nxt, 'sym', None) == '('):
+      result.append(symap['@'])
     result.append(nxt)
     prev = nxt
   return result
 
 
 @rewrites
+@visits(Expr)
 def precedence(node, depth):
   """ Parses operator precedence """
   if not isinstance(node, Expr):
@@ -286,6 +401,7 @@ def precedence(node, depth):
 
 
 @rewrites
+@visits(Lambda)
 def func_args(func, depth):
   """ Parses function arguments. """
   if not isinstance(func, Lambda):
@@ -312,6 +428,7 @@ def array_csv(array, depth):
 
 
 @rewrites
+@visits(Call)
 def call_args(call, depth):
   if not isinstance(call, Call):
     return call
@@ -339,4 +456,5 @@ def parse(ast):
   for f in rewrite_funcs:
     log.rewrite("aplying", f.__name__)
     ast = rewrite(ast, f)
+  ast = rewrite(ast, locate_children)
   return ast
\ No newline at end of file
@@ -0,0 +1,515 @@
+#!/usr/bin/env python3
+"""
+Python backend. Bodies of functions are translated into python
+source, compiled into code objects and called instead of walking
+the tree. Generated code works with the same values and frames as
+the interpreter (deadscript is dynamically scoped, so variables are
+still looked up in frames), but there is no eval() dispatch per
+node: arithmetic on Int, comparisons, branches and calls become
+python statements. Nodes without a translation are evaluated by
+the interpreter from the generated code.
+
+Code objects are cached on disk keyed by a hash of the generated
+source, so unchanged programs skip compile().
+"""
+from interpreter import Int, Str, ShellCmd, Bool, Var, Assign, Block, Parens, \
+  Print, Assert, Add, Sub, Mul, Pow, Eq, Less, More, Subscript, RegMatch, \
+  RegEx, IfElse, IfThen, Match, AlwaysTrue, Comment, Call, Call0, Func, \
+  Func0, ComposeR, ComposerL, Array, Value, Stream, run_command, to_array, \
+  code_positions, code_functions, compatible
+from ast import Unary, walk, position
+from frame import Frame
+from log import Log
+import output
+import re
+import os
+
+log = Log("compiler")
+
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "deadscript")
+translations = {}
+
+
+class translates:
+  """ Decorator to register translation of nodes of exactly
+      these types (subclasses behave differently, e.g., AwaitVar).
+  """
+  def __init__(self, *types):
+    self.types = types
+
+  def __call__(self, f):
+    for t in self.types:
+      translations[t] = f
+    return f
+
+
+class Compiled(Unary):
+  """ Body of a function replaced by generated code. The original
+      body is kept for type inference and to be sent to pmap workers.
+  """
+  code = None
+  names = None  # names of arguments of the function
+
+  def eval(self, frame):
+    return self.code(frame)
+
+  def infer_type(self, frame):
+    return self.arg.infer_type(frame)
+
+  def __reduce_ex__(self, protocol):
+    return uncompiled, (self.arg,)
+
+
+def uncompiled(body):
+  return body
+
+
+###########
+# RUNTIME #
+###########
+
+new = object.__new__
+TRUE, FALSE = Bool(True), Bool(False)
+
+
+def box(value):
+  """ Int(value) without the checks of the constructor. """
+  n = new(Int)
+  n.value = value
+  return n
+
+
+def unknown(e):
+  return Exception("unknown variable \"%s\"" % e.args[0]).with_traceback(e.__traceback__)
+
+
+def binop(name, same_type_operands, left, right):
+  """ Operation on values the generated code has no fast path for
+      (see InlineCache.lookup).
+  """
+  ltype, rtype = type(left), type(right)
+  if same_type_operands and not compatible(ltype, rtype):
+    raise Exception("%s:" \
+    "left and right values should have the same type, " \
+    "got\n %s \nand\n %s instead" % (name, left, right))
+  assert hasattr(left, name), \
+    "%s (%s) does not support %s operation" % (left, ltype, name)
+  return getattr(ltype, name)(left, right)
+
+
+def regmatch(left, right, frame):
+  assert hasattr(left, 'RegMatch'), \
+    "%s (%s) does not support %s operation" % (left, type(left), 'RegMatch')
+  return left.RegMatch(right, frame=frame)
+
+
+def call(func, frame, values):
+  """ Calls a function with values of its arguments. """
+  if type(func) is Func:
+    body = func[1]
+    if type(body) is Compiled:
+      names = body.names
+      assert len(names) == len(values)
+      newframe = Frame(frame)
+      newframe.dict = dict(zip(names, values))
+      return body.code(newframe)
+  assert len(func.args) == len(values)
+  with frame as newframe:
+    for k, v in zip(func.args, values):
+      newframe[k.value] = v
+    return func.Call(newframe)
+
+
+def call0(func, frame):
+  with frame as newframe:
+    return func.Call(newframe)
+
+
+def show(r, frame):
+  out = output.out
+  if isinstance(r, Stream):
+    for x in r.items(frame):
+      out.write(x.to_string(frame))
+    return r
+  out.write(r.to_string(frame))
+  return r
+
+
+def check(r, arg):
+  if not r:
+    raise Exception("Assertion failed on %s" % arg)
+  return r
+
+
+##################
+# CODE GENERATOR #
+##################
+
+class Codegen:
+  """ Translates functions into one python module. Values the code
+      refers to (literals, nodes evaluated by the interpreter) are
+      globals of the module named k0, k1, etc.
+  """
+  def __init__(self):
+    self.lines = []
+    self.positions = []  # (line, column) in deadscript for every line
+    self.consts = {}
+    self.count = 0
+    self.locals = {}     # variables kept in python locals
+    self.origin = None   # node the last translated expression comes from
+
+  def const(self, value):
+    name = "k%s" % len(self.consts)
+    self.consts[name] = value
+    return name
+
+  def temp(self):
+    self.count += 1
+    return "t%s" % self.count
+
+  def emit(self, line, indent, node=None):
+    """ Adds a line of code, by default it comes from the node of
+        the last expression (errors are reported at its position).
+    """
+    self.lines.append("  "*indent + line)
+    self.positions.append(position(node or self.origin))
+
+  def atom(self, node, indent):
+    """ Returns a name holding the value of the node. """
+    e = self.expr(node, indent)
+    if e.isidentifier():
+      return e
+    t = self.temp()
+    self.emit("%s = %s" % (t, e), indent)
+    return t
+
+  def expr(self, node, indent):
+    """ Emits statements the node needs and returns a python
+        expression with its value.
+    """
+    f = translations.get(type(node), interpreted)
+    e = f(self, node, indent)
+    if type(node) not in (Block, Parens) and position(node):
+      self.origin = node
+    return e
+
+  def cond(self, node, indent):
+    """ Like expr() for conditions, truth of the result is
+        all that matters.
+    """
+    node = strip(node)
+    if type(node) in compares:
+      e = compare(self, node, indent, raw=True)
+      self.origin = node
+      return e
+    if type(node) is AlwaysTrue:
+      return "True"
+    return self.expr(node, indent)
+
+  def function(self, name, func):
+    args = [arg.value for arg in func.args] if type(func) is Func else []
+    read = set(n.value for n in walk(func.body) if type(n) is Var)
+    self.locals = {arg: "v%s" % i for i, arg in enumerate(args)
+                   if arg in read and arg not in written(func.body)}
+    self.count = 0
+    self.emit("def %s(frame):" % name, 0, func)
+    self.emit("try:", 1, func)
+    if self.locals:
+      self.emit("d = frame.dict", 2, func)
+    for arg, local in self.locals.items():
+      self.emit("%s = d[%r]" % (local, arg), 2, func)
+    self.emit("return %s" % self.expr(func.body, 2), 2)
+    self.emit("except KeyError as e:", 1, func)
+    self.emit("raise unknown(e)", 2, func)
+    self.emit("", 0, func)
+
+  def source(self):
+    return "\n".join(self.lines) + "\n"
+
+
+def strip(node):
+  while type(node) is Parens:
+    node = node.arg
+  return node
+
+
+def written(body):
+  """ Names a function body can assign in its frame. """
+  names = set()
+  for n in walk(body):
+    if isinstance(n, Assign) and isinstance(n.left, Var):
+      names.add(n.left.value)
+    elif isinstance(n, RegEx):
+      names.update(re.compile(n.value).groupindex)
+  return names
+
+
+def interpreted(gen, node, indent):
+  """ Nodes without a translation are evaluated by the interpreter. """
+  return "%s.eval(frame)" % gen.const(node)
+
+
+@translates(Int, Str, Bool, RegEx, Func, Func0, AlwaysTrue)
+def translate_value(gen, node, indent):
+  if isinstance(node, Str) and node.template:
+    return translate_template(gen, node, indent)
+  return gen.const(node)
+
+
+@translates(ShellCmd)
+def translate_shell(gen, node, indent):
+  return "run_command(%s.value)" % translate_template(gen, node, indent)
+
+
+def translate_template(gen, node, indent):
+  if not node.template:
+    return "Str(%r)" % node.value
+  parts = []
+  for i, part in enumerate(node.template):
+    if i % 2:
+      parts.append("%s.to_string(frame)" % translate_var(gen, Var(part), indent))
+    elif part:
+      parts.append(repr(part))
+  return "Str(%s)" % " + ".join(parts or ["''"])
+
+
+@translates(Comment)
+def translate_comment(gen, node, indent):
+  return "None"
+
+
+@translates(Var)
+def translate_var(gen, node, indent):
+  return gen.locals.get(node.value) or "frame[%r]" % node.value
+
+
+@translates(Parens)
+def translate_parens(gen, node, indent):
+  return gen.expr(node.arg, indent)
+
+
+@translates(Assign)
+def translate_assign(gen, node, indent):
+  if not isinstance(node.left, Var):
+    return interpreted(gen, node, indent)
+  value = gen.atom(node.right, indent)
+  gen.emit("frame[%r] = %s" % (node.left.value, value), indent, node)
+  return value
+
+
+@translates(Block)
+def translate_block(gen, node, indent):
+  value = "None"
+  for i, e in enumerate(node):
+    if i == len(node) - 1:
+      value = gen.expr(e, indent)
+    else:
+      e = gen.expr(e, indent)
+      if not e.isidentifier() and e != "None":
+        gen.emit(e, indent)
+  return value
+
+
+@translates(Print)
+def translate_print(gen, node, indent):
+  return "show(%s, frame)" % gen.expr(node.arg, indent)
+
+
+@translates(Assert)
+def translate_assert(gen, node, indent):
+  return "check(%s, %s)" % (gen.expr(node.arg, indent), gen.const(node.arg))
+
+
+arithmetic = {Add: '+', Sub: '-', Mul: '*', Pow: '**'}
+compares = {Eq: '==', Less: '<', More: '>'}
+
+
+def operands(gen, node, indent):
+  """ Returns names of the operands and a check that both are Int,
+      python ints of Int literals are used as they are.
+  """
+  left, right = strip(node.left), strip(node.right)
+  lname = gen.atom(left, indent)
+  rname = gen.atom(right, indent)
+  checks, values = [], []
+  for n, name in ((left, lname), (right, rname)):
+    if type(n) is Int:
+      values.append(repr(n.value))
+    else:
+      checks.append("type(%s) is Int" % name)
+      values.append("%s.value" % name)
+  return lname, rname, " and ".join(checks) or "True", values
+
+
+@translates(*arithmetic)
+def translate_arithmetic(gen, node, indent):
+  name = node.__class__.__name__
+  left, right, check, (a, b) = operands(gen, node, indent)
+  return "(box(%s %s %s) if %s else binop(%r, True, %s, %s))" % \
+         (a, arithmetic[type(node)], b, check, name, left, right)
+
+
+@translates(*compares)
+def compare(gen, node, indent, raw=False):
+  name = node.__class__.__name__
+  left, right, check, (a, b) = operands(gen, node, indent)
+  fast = "%s %s %s" % (a, compares[type(node)], b)
+  if not raw:
+    fast = "(TRUE if %s else FALSE)" % fast
+  return "(%s if %s else binop(%r, True, %s, %s))" % (fast, check, name, left, right)
+
+
+@translates(Subscript)
+def translate_subscript(gen, node, indent):
+  left = gen.atom(node.left, indent)
+  right = gen.atom(node.right, indent)
+  return "binop('Subscript', False, %s, %s)" % (left, right)
+
+
+@translates(RegMatch)
+def translate_regmatch(gen, node, indent):
+  if type(node.left) is RegEx:
+    return "%s.RegMatch(%s, frame)" % (gen.const(node.left), gen.expr(node.right, indent))
+  left = gen.atom(node.left, indent)
+  right = gen.atom(node.right, indent)
+  return "regmatch(%s, %s, frame)" % (left, right)
+
+
+@translates(IfElse)
+def translate_ifelse(gen, node, indent):
+  t = gen.temp()
+  gen.emit("if %s:" % gen.cond(node.iff, indent), indent)
+  gen.emit("%s = %s" % (t, gen.expr(node.then, indent+1)), indent+1)
+  gen.emit("else:", indent, node)
+  gen.emit("%s = %s" % (t, gen.expr(node.otherwise, indent+1)), indent+1)
+  return t
+
+
+@translates(Match)
+def translate_match(gen, node, indent):
+  arms = list(node.arg)
+  if not all(type(arm) is IfThen for arm in arms):
+    return interpreted(gen, node, indent)
+  t = gen.temp()
+  gen.emit("%s = None" % t, indent, node)
+  # arms go to elif while their conditions need no statements
+  keyword = "if"
+  for arm in arms:
+    mark = len(gen.lines)
+    cond = gen.cond(arm.iff, indent)
+    if len(gen.lines) > mark and keyword == "elif":
+      # move the statements of the condition into the else branch
+      lines, gen.lines[mark:] = gen.lines[mark:], []
+      positions, gen.positions[mark:] = gen.positions[mark:], []
+      gen.emit("else:", indent, arm)
+      indent += 1
+      gen.lines += ["  " + line for line in lines]
+      gen.positions += positions
+      keyword = "if"
+    gen.emit("%s %s:" % (keyword, cond), indent)
+    gen.emit("%s = %s" % (t, gen.expr(arm.then, indent+1)), indent+1)
+    keyword = "elif"
+  return t
+
+
+def call_values(gen, node, indent):
+  if isinstance(node.args, Array):
+    argnodes = list(node.args)
+  else:
+    argnodes = [node.args]
+  values = [gen.atom(arg, indent) for arg in argnodes]
+  return "(%s)" % "".join(v + "," for v in values)
+
+
+@translates(Call)
+def translate_call(gen, node, indent):
+  func = gen.atom(node.func, indent)
+  return "call(%s, frame, %s)" % (func, call_values(gen, node, indent))
+
+
+@translates(Call0)
+def translate_call0(gen, node, indent):
+  if type(node.arg) is not Var:
+    return interpreted(gen, node, indent)
+  return "call0(%s, frame)" % translate_var(gen, node.arg, indent)
+
+
+@translates(ComposeR)
+def translate_compose(gen, node, indent):
+  right = gen.atom(node.right, indent)
+  left = gen.atom(node.left, indent)
+  return "call(%s, frame, (%s,))" % (left, right)
+
+
+@translates(ComposerL)
+def translate_pipe(gen, node, indent):
+  left = gen.atom(node.left, indent)
+  right = gen.atom(node.right, indent)
+  return "call(%s, frame, (%s,))" % (right, left)
+
+
+@translates(Array)
+def translate_array(gen, node, indent):
+  values = [gen.atom(x, indent) for x in node]
+  return "to_array([%s])" % ", ".join(values)
+
+
+#########
+# CACHE #
+#########
+
+def load_code(source, filename):
+  """ Compiles the source or loads its code object from the cache. """
+  from hashlib import sha256
+  from importlib.util import MAGIC_NUMBER
+  import marshal
+  digest = sha256(source.encode()).hexdigest()
+  path = os.path.join(CACHE_DIR, digest + ".pyc") if CACHE_DIR else None
+  if path:
+    try:
+      with open(path, 'rb') as fd:
+        data = fd.read()
+      if data.startswith(MAGIC_NUMBER):
+        code = marshal.loads(data[len(MAGIC_NUMBER):])
+        if code.co_filename == filename:
+          log.cache("loaded", path)
+          return code
+    except (OSError, ValueError, EOFError, TypeError):
+      pass
+  code = compile(source, filename, 'exec')
+  if path:
+    try:
+      os.makedirs(CACHE_DIR, exist_ok=True)
+      tmp = "%s.%s" % (path, os.getpid())
+      with open(tmp, 'wb') as fd:
+        fd.write(MAGIC_NUMBER + marshal.dumps(code))
+      os.replace(tmp, path)
+      log.cache("saved", path)
+    except OSError as e:
+      log.cache("cannot save", path, e)
+  return code
+
+
+def compile_functions(tree):
+  """ Replaces bodies of all functions in the tree with compiled ones. """
+  from hashlib import sha256
+  funcs = [n for n in walk(tree) if type(n) in (Func, Func0)]
+  if not funcs:
+    return tree
+  gen = Codegen()
+  for i, func in enumerate(funcs):
+    gen.function("f%s" % i, func)
+  source = gen.source()
+  log.codegen("generated code:\n", source)
+  filename = "<deadscript %s>" % sha256(source.encode()).hexdigest()[:16]
+  code_positions[filename] = gen.positions
+  namespace = dict(globals())
+  namespace.update(gen.consts)
+  exec(load_code(source, filename), namespace)
+  for i, func in enumerate(funcs):
+    body = Compiled(func.body)
+    body.code = namespace["f%s" % i]
+    code_functions[body.code.__code__] = func
+    body.names = tuple(arg.value for arg in func.args) if type(func) is Func else ()
+    func.body = body
+  return tree
@@ -1,16 +1,117 @@
 #!/usr/bin/env python3
 
-
-from indent import parse as indent_parse
-from ast import parse, pretty_print
-from tokenizer import tokenize
-from interpreter import run
-from log import logfilter
+# Modules are imported by phases, so runs that do not execute code
+# (e.g., --dry-run, --tokens) do not pay for the interpreter.
+from time import perf_counter
+started = perf_counter()
 
 from sys import exit
+import sys
 import argparse
 
 
+class Timings:
+  """ Measures startup phases and modules imported by them
+      (see --timings and --budget).
+  """
+  def __init__(self, start):
+    self.start = start
+    self.phases = []
+
+  def phase(self, name, f, *args, **kwargs):
+    modules = set(sys.modules)
+    t = perf_counter()
+    r = f(*args, **kwargs)
+    t = perf_counter() - t
+    self.phases.append((name, t, sorted(set(sys.modules) - modules)))
+    return r
+
+  def elapsed(self):
+    return (perf_counter() - self.start) * 1000
+
+  def report(self):
+    lines = []
+    for name, t, modules in self.phases:
+      lines.append("%-10s %8.2fms  %s" % (name, t*1000, " ".join(modules)))
+    lines.append("%-10s %8.2fms" % ("total", self.elapsed()))
+    return "\n".join(lines)
+
+
+def import_frontend():
+  global tokenize, indent_parse, parse, pretty_print
+  from tokenizer import tokenize
+  from indent import parse as indent_parse
+  from ast import parse, pretty_print
+
+
+def import_interpreter():
+  global interpreter
+  import interpreter
+
+
+def report_error(path, pos, exc):
+  """ Prints the error with the line of source it comes from. """
+  from linecache import getline
+  line, col = pos
+  print("%s:%s:%s: %s" % (path, line, col, exc), file=sys.stderr)
+  print("  " + getline(path, line).rstrip(), file=sys.stderr)
+  print("  " + " "*(col-1) + "^", file=sys.stderr)
+
+
+def execute(ast, args):
+  """ Runs the program and prints requested statistics. """
+  cmd = [args.input]+args.cmd
+  try:
+    r = interpreter.run(ast, cmd, check_types=args.check_types,
+                        inline=not args.no_inline, jobs=args.jobs,
+                        async_io=args.async_io, backend=args.backend,
+                        skip=args.skip_pass)
+  except Exception as e:
+    pos = interpreter.error_position(e)
+    if pos is None or args.debug:
+      raise
+    report_error(args.input, pos, e)
+    return 1
+  if args.ic_stats:
+    print(interpreter.ic_report(), file=sys.stderr)
+  if args.memo_stats:
+    print(interpreter.memo_report(), file=sys.stderr)
+  return r
+
+
+def watch(args, interval=0.5):
+  """ Reparses and reruns the program every time the file changes. """
+  from incremental import IncrementalParser
+  from traceback import print_exc
+  import time
+  import os
+  parser = IncrementalParser()
+  mtime = None
+  while True:
+    try:
+      newmtime = os.stat(args.input).st_mtime
+    except OSError:
+      newmtime = None
+    if newmtime is not None and newmtime != mtime:
+      mtime = newmtime
+      try:
+        with open(args.input) as fd:
+          src = fd.read()
+        if args.tokens:
+          print(tokenize(src))
+        ast = parser.parse(src)
+        if args.ast:
+          pretty_print(ast)
+        if not args.dry_run:
+          r = execute(ast, args)
+          print("exited with %s" % r, file=sys.stderr)
+      except Exception:
+        print_exc()
+      print("waiting for changes of %s (%s chunks reused, %s reparsed)" % \
+            (args.input, parser.reused, parser.reparsed), file=sys.stderr)
+    time.sleep(interval)
+
+
 if __name__ == '__main__':
   parser = argparse.ArgumentParser()
   parser.add_argument('-t', '--tokens', action='store_const', const=True,
@@ -23,10 +124,59 @@ if __name__ == '__main__':
                       default=False, help="do not execute the program")
   parser.add_argument('-c', '--check-types', action='store_const', const=True,
                       default=False, help="perform type inference and checking (disabled by default)")
+  parser.add_argument('-b', '--backend', default='tree',
+                      help="how to execute the program: tree (default), unboxed or python")
+  parser.add_argument('--code-cache', default=None, metavar='DIR',
+                      help="where the python backend keeps compiled code, empty to disable")
+  parser.add_argument('--skip-pass', action='append', default=[], metavar='NAME',
+                      help="do not run an optimization pass over the IR (inline, regex)")
+  parser.add_argument('--no-inline', action='store_const', const=True,
+                      default=False, help="do not inline small functions")
+  parser.add_argument('--ic-stats', action='store_const', const=True,
+                      default=False, help="show hit rates of inline caches")
+  parser.add_argument('--memo-stats', action='store_const', const=True,
+                      default=False, help="show hit rates of memoized functions")
+  parser.add_argument('--memo-size', type=int, default=None,
+                      help="number of results cached by a memoized function")
+  parser.add_argument('--workers', type=int, default=None,
+                      help="number of processes used by pmap (all cores by default)")
+  parser.add_argument('-j', '--jobs', type=int, default=1,
+                      help="threads for top-level assignments waiting for I/O")
+  parser.add_argument('--async-io', action='store_const', const=True,
+                      default=False, help="run shell commands and reads assigned to variables concurrently")
+  parser.add_argument('--io-concurrency', type=int, default=None,
+                      help="number of commands running at the same time with --async-io")
+  parser.add_argument('--io-timeout', type=float, default=None, metavar='SECONDS',
+                      help="fail if a shell command runs longer")
+  parser.add_argument('-o', '--output', default=None, metavar='PATH',
+                      help="write output of the program to a (memory-mapped) file")
+  parser.add_argument('--output-buffer', type=int, default=None, metavar='CHARS',
+                      help="characters of output collected before writing them, 0 writes "
+                           "every line at once (the default for terminals)")
+  parser.add_argument('--preallocate', type=int, default=1 << 20, metavar='BYTES',
+                      help="space allocated for --output in advance")
+  parser.add_argument('--metrics', default=None, metavar='PATH',
+                      help="write runtime counters at exit (- for stderr)")
+  parser.add_argument('--metrics-format', choices=['json', 'prometheus'], default='json',
+                      help="format of --metrics")
+  parser.add_argument('--sample', default=None, metavar='PATH',
+                      help="write a sampling profile as folded stacks (also on SIGUSR1)")
+  parser.add_argument('--sample-interval', type=float, default=10, metavar='MS',
+                      help="time between samples of --sample")
+  parser.add_argument('-w', '--watch', action='store_const', const=True,
+                      default=False, help="rerun the program when the file changes")
+  parser.add_argument('--timings', action='store_const', const=True,
+                      default=False, help="show time spent in startup phases and their imports")
+  parser.add_argument('--budget', type=float, default=None, metavar='MS',
+                      help="fail if startup (everything before execution) takes longer")
   parser.add_argument('input', help="path to file")
   parser.add_argument('cmd', nargs="*")
   args = parser.parse_args()
 
+  timings = Timings(started)
+  timings.phase("frontend", import_frontend)
+
+  from log import logfilter
   logfilter.rules = [
     # ('interpreter.*', False),
     # ('indent.*', False)
@@ -35,22 +185,69 @@ if __name__ == '__main__':
   if args.debug: logfilter.default = True
   else:          logfilter.default = False
 
+  if not args.dry_run or args.watch:
+    timings.phase("interpreter", import_interpreter)
+    if args.backend not in interpreter.backends:
+      parser.error("unknown backend %s (available: %s)" % \
+                   (args.backend, ", ".join(interpreter.backends)))
+    if args.memo_size:
+      interpreter.MEMO_SIZE = args.memo_size
+    if args.workers:
+      interpreter.MAP_WORKERS = args.workers
+    if args.io_concurrency:
+      interpreter.IO_CONCURRENCY = args.io_concurrency
+    interpreter.IO_TIMEOUT = args.io_timeout
+    if args.code_cache is not None:
+      import compiler
+      compiler.CACHE_DIR = args.code_cache
+    if args.metrics:
+      import metrics
+      import atexit
+      metrics.enable()
+      atexit.register(metrics.dump, args.metrics, args.metrics_format)
+    import output
+    if args.output:
+      size = output.BUFFER_SIZE if args.output_buffer is None else args.output_buffer
+      output.out = output.MappedOutput(args.output, size, args.preallocate)
+    else:
+      output.out = output.Output(size=args.output_buffer)
+
+  if args.sample and not args.dry_run:
+    import profiler
+    sampler = profiler.Sampler(args.sample, args.input, args.sample_interval / 1000)
+    sampler.start()
+    import signal
+    if hasattr(signal, 'SIGUSR1'):
+      signal.signal(signal.SIGUSR1, lambda signum, frame: sampler.dump())
+
+  if args.watch:
+    try:
+      watch(args)
+    except KeyboardInterrupt:
+      exit(0)
+
   with open(args.input) as fd:
     # split source into tokens
     src = fd.read()
-    tokens = tokenize(src)
+    tokens = timings.phase("tokenize", tokenize, src)
     if args.tokens:
       print(tokens)
 
     # parse indentation
-    ast = indent_parse(tokens)
+    ast = timings.phase("indent", indent_parse, tokens)
 
     # finalize AST generation
-    ast = parse(ast)
+    ast = timings.phase("parse", parse, ast)
     if args.ast:
       pretty_print(ast)
 
-    cmd = [args.input]+args.cmd
+    if args.timings:
+      print(timings.report(), file=sys.stderr)
+    if args.budget is not None and timings.elapsed() > args.budget:
+      print("startup took %.2fms, budget is %.2fms" % (timings.elapsed(), args.budget),
+            file=sys.stderr)
+      exit(1)
+
     # run the program
     if not args.dry_run:
-      exit(run(ast, cmd, check_types=args.check_types))
\ No newline at end of file
+      exit(execute(ast, args))
@@ -1,35 +1,69 @@
 #!/usr/bin/env python3
-from collections import OrderedDict
+
+EMPTY = {}
 
 
 class Frame:
+  """ Scope of variables. Besides its own variables, a frame keeps a
+      flattened copy of everything visible in the parent (taken on
+      the first lookup that misses the frame's own variables), so
+      lookups do not depend on the depth of the chain. Code writes
+      only to its current frame and a parent does not run while its
+      child does, so copies do not get outdated. Flattened views are
+      never changed, a write only drops the view of the frame.
+  """
   def __init__(self, parent=None):
-    self.dict = OrderedDict()
+    self.dict = {}
     self.parent = parent
     self.depth = (self.parent.depth + 1) if self.parent else 0
+    self.base = None    # flattened parent
+    self.cached = None  # flattened self
+
+  def get_base(self):
+    if self.base is None:
+      self.base = self.parent.view() if self.parent else EMPTY
+    return self.base
+
+  def view(self):
+    """ Returns all visible variables (do not modify the result). """
+    if self.cached is None:
+      base = self.get_base()
+      self.cached = {**base, **self.dict} if self.dict else base
+    return self.cached
+
+  def snapshot(self):
+    """ Returns a frame with the current variables, later assignments
+        to this frame are not visible in it.
+    """
+    frame = Frame()
+    frame.base = self.view()
+    return frame
 
   def update(self, d):
     self.dict.update(d)
+    self.cached = None
 
   def keys(self):
-    result = list(self.dict.keys())
-    if self.parent:
-      result.extend(list(self.parent.keys()))
-    return result
+    return self.view().keys()
+
+  def get(self, key, default=None):
+    return self.view().get(key, default)
 
   def __setitem__(self, key, value):
     self.dict[key] = value
+    self.cached = None
+
+  def __contains__(self, key):
+    return key in self.dict or key in self.get_base()
 
   def __iter__(self):
-    return iter(self.dict)
+    return iter(self.view())
 
   def __getitem__(self, key):
-    try:
-      return self.dict[key]
-    except KeyError:
-      if not self.parent:
-        raise
-    return self.parent[key]
+    d = self.dict
+    if key in d:
+      return d[key]
+    return (self.base if self.base is not None else self.get_base())[key]
 
   def __repr__(self):
     cls = self.__class__.__name__
@@ -47,4 +81,4 @@ if __name__ == '__main__':
   frame['a'] = 1
   print(frame['a'])
   with frame as nested:
-    print(nested['a'])
\ No newline at end of file
+    print(nested['a'])
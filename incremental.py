@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Incremental parsing. Top-level expressions do not depend on each
+other at the parsing stage, so the source is split into chunks
+(a line without indentation plus all following indented lines)
+and only chunks that changed since the previous parse are
+tokenized and rewritten again.
+"""
+
+from tokenizer import Tokens, tokenize_line
+from indent import parse as indent_parse
+from ast import parse, Block, clone
+from log import Log
+log = Log("incremental")
+
+
+def chunks(raw):
+  """ Splits source into top-level chunks. Yields the number
+      of the first line and the lines of the chunk.
+  """
+  start, lines = 1, []
+  for i, l in enumerate(raw.splitlines(), 1):
+    if l and not l[0].isspace() and lines:
+      yield start, lines
+      start, lines = i, []
+    lines.append(l)
+  if lines:
+    yield start, lines
+
+
+class IncrementalParser:
+  """ Keeps tokens of every line and ASTs of every chunk
+      from the previous parse.
+  """
+  def __init__(self):
+    self.tokens = {}   # line -> tokens
+    self.trees = {}    # chunk -> AST, line it was parsed at
+    self.reused = self.reparsed = 0
+
+  def tokenize(self, lines, start):
+    tokens = Tokens("\n".join(lines))
+    offset = 0
+    for i, l in enumerate(lines, start):
+      if l:
+        if l not in self.tokens:
+          self.tokens[l] = tokenize_line(Tokens(l), l, 0, len(l), i)
+        tokens.extend(self.tokens[l], offset, i)
+      offset += len(l) + 1
+    return tokens
+
+  def parse_chunk(self, lines, start):
+    """ Returns a copy of the AST of the chunk, positions in
+        the copy are moved to where the chunk is now.
+    """
+    key = "\n".join(lines)
+    try:
+      tree, parsed_at = self.trees[key]
+      self.reused += 1
+    except KeyError:
+      log.reparse("reparsing lines", start, "-", start+len(lines)-1)
+      tree, parsed_at = parse(indent_parse(self.tokenize(lines, start))), start
+      self.trees[key] = tree, parsed_at
+      self.reparsed += 1
+    return clone(tree, start - parsed_at)
+
+  def parse(self, raw):
+    """ Parses source into AST reusing unchanged chunks. Chunks
+        are copied, so they can be modified by later stages.
+    """
+    self.reused = self.reparsed = 0
+    ast = Block()
+    used_lines, used_trees = set(), set()
+    for start, lines in chunks(raw):
+      ast.extend(self.parse_chunk(lines, start))
+      used_lines.update(lines)
+      used_trees.add("\n".join(lines))
+    # forget what is not in the source anymore
+    self.tokens = {l: t for l, t in self.tokens.items() if l in used_lines}
+    self.trees = {k: t for k, t in self.trees.items() if k in used_trees}
+    log("%s chunks reused, %s reparsed" % (self.reused, self.reparsed))
+    return ast
@@ -1,42 +1,52 @@
 from tokenizer import DENT
 from log import Log
-from copy import copy
-from ast import Block, Expr
+from array import array
+from ast import Block, Expr, Leaf, locate
 log = Log("indent")
 
 
-def implicit_dents(tokens):
-  tokens = copy(tokens)
+def dents(tokens):
+  """ Returns indices of tokens in the order they are parsed: a dent
+      is added after an arrow followed by an indented block (so the
+      block is parsed as its body) and only the last one of several
+      dents in a row is kept.
+  """
+  order = array('L')
+  def emit(i):
+    if order and tokens.is_dent(i) and tokens.is_dent(order[-1]):
+      order[-1] = i
+    else:
+      order.append(i)
   c = 0
-  for i,t in enumerate(tokens):
-    if isinstance(t, DENT):
-      c = t.value
-    elif hasattr(t, "sym") and t.sym in ["->", "=>"]:
-      for t in tokens[i:]:
-        if isinstance(t, DENT):
-          if t.value > c:
-            tokens.insert(i+1, DENT(t.value))
-          break
-  return tokens
-
-
-def merge_dents(tokens):
-  tokens = copy(tokens)
-  i = 0
-  while i < len(tokens)-1:
-    if isinstance(tokens[i], DENT) and isinstance(tokens[i+1], DENT):
-      del tokens[i]
+  pending = []  # tokens from the first arrow of a line to the next dent
+  for i in range(len(tokens)):
+    if tokens.is_dent(i):
+      lvl = tokens.indent(i)
+      if pending:
+        emit(pending[0])
+        if lvl > c:
+          emit(i)
+        for t in pending[1:]:
+          emit(t)
+        pending = []
+      c = lvl
+      emit(i)
+    elif pending or tokens.symbol(i) in ("->", "=>"):
+      pending.append(i)
     else:
-      i += 1
-  return tokens
+      emit(i)
+  for t in pending:
+    emit(t)
+  return order
 
 
 def blocks(it, lvl=0):
+  """ Groups tokens (with their positions) into blocks of expressions. """
   cur = lvl
   expr = Expr()
   blk = Block(expr)
   prefix = str(lvl)+" "*(lvl-1)
-  for t in it:
+  for t, pos in it:
     log.indent(prefix, "considering", t)
     if isinstance(t, DENT):
       cur = t.value
@@ -48,26 +58,28 @@ def blocks(it, lvl=0):
       elif cur > lvl:
         log.indent(prefix, ">>> calling nested block")
         r, cur = blocks(it, cur)
-        log.indent(prefix, "<<< got %s from it with level %s" % (r, cur))
+        log.indent(prefix, "<<< got", r, "from it with level", cur)
         expr.append(r)
         if cur == lvl:
           log.indent(prefix, "!!! starting new expression")
           expr = Expr()
           blk.append(expr)
     else:
-      log.indent(prefix, "adding %s to expr %s" % (t,expr))
+      log.indent(prefix, "adding", t, "to expr", expr)
+      if not expr:
+        locate(expr, *pos)
+      if isinstance(t, Leaf):
+        locate(t, *pos)
       expr.append(t)
     if cur < lvl:
-        log.indent(prefix, "<== %s < %s: time to return" % (cur, lvl))
+        log.indent(prefix, "<==", cur, "<", lvl, ": time to return")
         return blk, cur
   return blk, lvl
 
 
 def parse(tokens):
-  tokens = implicit_dents(tokens)
-  log.imp_dents("after adding implicit dents:\n", tokens)
-  tokens = merge_dents(tokens)
-  log.merge_dents("merging dents:\n", tokens)
-  ast, _ = blocks(iter(tokens))
+  order = dents(tokens)
+  log.dents("after adding implicit and merging dents:\n", order)
+  ast, _ = blocks((tokens[i], tokens.position(i)) for i in order)
   log.blocks("after block parser:\n", ast)
   return ast
\ No newline at end of file
@@ -1,33 +1,40 @@
-from ast import Node, ListNode, Unary, Binary, Leaf, rewrite
-from collections import OrderedDict
+from ast import Node, ListNode, Unary, Binary, Leaf, rewrite, walk, visits, clone
+from collections import OrderedDict, Counter
 from frame import Frame
 from log import Log
+import output
 import ast
 
-from subprocess import check_output
-import shlex
+from itertools import repeat, islice
+from array import array
+import operator
 import re
 
 log = Log("interpreter")
 astMap = OrderedDict()
 
 
+unboxMap = OrderedDict()
+
+
 class replaces:
   """ Decorator to substitute nodes in AST. """
-  def __init__(self, oldCls):
+  def __init__(self, oldCls, registry=astMap):
     self.oldCls = oldCls
+    self.registry = registry
 
   def __call__(self, newCls):
-    astMap[self.oldCls] = newCls
+    self.registry[self.oldCls] = newCls
     return newCls
 
 
 def replace_nodes(node, depth):
     for oldCls, newCls in astMap.items():  #may be it should do newCls = asMap(type(node))??
       if isinstance(node, oldCls):
-        log.replace("replacing %s (%s)" % (node, type(node)))
+        log.replace("replacing", node, type(node))
         if isinstance(node, Leaf):
-          return newCls(node.value)
+          # literals can be prepared once (see Str.literal)
+          return getattr(newCls, 'literal', newCls)(node.value)
         return newCls(*node)
     return node
 
@@ -77,8 +84,36 @@ class Type:
            self.ret  == other.ret
 
 
+class Unknown:
+  """ Type of expressions that cannot be inferred yet
+      (e.g., a result of recursive call).
+  """
+
+
+def known(*types):
+  """ Returns the first type that is not Unknown. """
+  for t in types:
+    if t.ret is not Unknown:
+      return t
+  return types[-1]
+
+
+def common(*types):
+  """ Returns the type known types agree on, Unknown if they differ. """
+  if len({t.ret for t in types} - {Unknown}) > 1:
+    return Type(None, Unknown)
+  return known(*types)
+
+
+def is_int(node):
+  """ Checks that type inference proved the node to be Int. """
+  t = getattr(node, 'type', None)
+  return t is not None and t.ret is Int
+
+
 class Value(Leaf):
   type = None
+  broadcast = False  # supports operations with values of other types
   """ Base class for values. """
 
   def infer_type(self, frame):
@@ -103,6 +138,9 @@ class Int(Value):
   def to_int(self):
     return self.value
 
+  def raw(self, frame):
+    return self.value
+
   def Add(self, right):
     return Int(self.value + right.value)
 
@@ -127,24 +165,125 @@ class Int(Value):
 
 @replaces(ast.Str)
 class Str(Value):
+  """ Concatenation appends to a list of parts shared with the left
+      operand (unless something was already appended to it), so
+      strings are built in linear time. Parts are joined only once,
+      when the value is needed. A string uses only the first count
+      parts: the list only grows, so they never change. The list and
+      the count are kept in one attribute (rope), so threads (see
+      eval_toplevel) always see them together.
+  """
+  interpolation = re.compile(r"\{([a-zA-Z\.]+)\}", re.M)
+  template = None  # literal split into text and names of variables
+
+  def __init__(self, value, rope=None):
+    super().__init__(value)
+    self.rope = rope  # (parts, count) or None
+
+  @classmethod
+  def literal(cls, value):
+    s = cls(value)
+    if '{' in value:
+      s.template = cls.interpolation.split(value)
+    return s
+
+  @property
+  def value(self):
+    if self.joined is None:
+      parts, count = self.rope
+      self.joined = "".join(parts[:count])
+      self.rope = [self.joined], 1
+    return self.joined
+
+  @value.setter
+  def value(self, value):
+    self.joined = value
+
+  def Add(self, other):
+    rope, text = self.rope, other.value
+    if rope is None:
+      parts = [self.value]
+    else:
+      parts, count = rope
+      if len(parts) == count:
+        parts.append(text)
+        # another thread may have appended first
+        if parts[count] is text:
+          return Str(None, (parts, count + 1))
+      parts = parts[:count]
+    parts.append(text)
+    return Str(None, (parts, len(parts)))
+
+  def eval(self, frame):
+    if not self.template:
+      return self
+    parts = self.template[:]
+    for i in range(1, len(parts), 2):
+      parts[i] = Var(parts[i]).eval(frame).to_string(frame)
+    return Str("".join(parts))
+
   def to_string(self, frame):
-    string = self.value
-    replace = {r'\n': '\n', r'\t': '\t'}
-    varnames = re.findall("\{([a-zA-Z\.]+)\}", string, re.M)
-    for name in varnames:
-        value = Var(name).eval(frame).to_string(frame)
-        string = string.replace("{%s}" % name, value)
-    for k,v in replace.items():
-      string = string.replace(k, v)
-    return string
+    return self.value
+
+
+class MappedStr(Str):
+  """ Text in a memory-mapped file, kept as offsets into the map.
+      It is decoded only when the value is needed and regular
+      expressions match the bytes in the map when that gives the same
+      result. The map is closed once no string refers to it.
+  """
+  non_ascii = re.compile(rb"[\x80-\xff]")
+  same_type_as = Str  # for operations with other strings
+  buf = None
+  start = end = 0
+  plain = None
+
+  def __init__(self, buf, start, end):
+    super().__init__(None)
+    self.buf, self.start, self.end = buf, start, end
+
+  @property
+  def value(self):
+    if self.joined is None:
+      self.joined = self.buf[self.start:self.end].decode()
+    return self.joined
+
+  @value.setter
+  def value(self, value):
+    self.joined = value
+
+  def matches_bytes(self):
+    """ Checks that matching the bytes at the offset is the same as
+        matching the decoded text: the text is ASCII (classes like
+        . and \\w see bytes) and starts a line (\\b looks back).
+    """
+    if self.plain is None:
+      self.plain = (self.start == 0 or self.buf[self.start-1] == 10) and \
+                   not self.non_ascii.search(self.buf, self.start, self.end)
+    return self.plain
+
+  def __reduce__(self):
+    return Str, (self.value,)
 
 
 @replaces(ast.ShellCmd)
 class ShellCmd(Str):
+  def infer_type(self, frame):
+    self.type = Type(None, Str)
+    return self.type
+
   def eval(self, frame):
-    cmd = super().eval(frame).to_string(frame)
-    raw = check_output(shlex.split(cmd))
-    return Str(raw.decode())
+    return run_command(super().eval(frame).to_string(frame))
+
+
+def run_command(cmd):
+  from subprocess import check_output, TimeoutExpired  # slow to import, load on demand
+  import shlex
+  try:
+    raw = check_output(shlex.split(cmd), timeout=IO_TIMEOUT)
+  except TimeoutExpired:
+    raise Exception("command \"%s\" timed out after %ss" % (cmd, IO_TIMEOUT))
+  return Str(raw.decode())
 
 
 @replaces(ast.Brackets)
@@ -155,19 +294,111 @@ class Array(ListNode):
     super().__init__(*args)
 
   def infer_type(self, frame):
-    print("TODO: array does not support type inference yet")
-    self.type = Type(None, self.__class__)
+    """ The element type is kept as the only argument
+        of the array type, e.g., (Int) -> Array.
+    """
+    elem_t = Type(None, Unknown)
+    for x in self:
+      t = x.infer_type(frame)
+      assert elem_t.ret in (Unknown, t.ret), \
+        "array elements should have the same type. " \
+        "Got \"%s\" and \"%s\"." % (elem_t, t)
+      elem_t = known(elem_t, t)
+    if elem_t.ret is Int:
+      self.type = Type([elem_t], IntArray)
+    else:
+      self.type = Type([elem_t], self.__class__)
     return self.type
 
   def to_string(self, frame):
     values = [x.eval(frame).to_string(frame) for x in self]
     return '[' + ", ".join(values) + ']'
 
+  def items(self, frame):
+    return (x.eval(frame) for x in self)
+
+  def length(self):
+    return len(self)
+
+  def slice(self, start, end):
+    return Array(self[start:end])
+
   def Subscript(self, idx):
     return self[idx.to_int()]
 
   def eval(self, frame):
-    return self
+    return to_array([x.eval(frame) for x in self])
+
+
+class IntArray(Value):
+  """ Homogeneous array of 64-bit ints backed by array.array.
+      Arithmetic is element-wise, the right operand can be
+      an array of the same length or Int. Results that do not
+      fit in 64 bits make a boxed Array.
+  """
+  broadcast = True
+
+  def __init__(self, values):
+    super().__init__(array('q', values))
+
+  def to_string(self, frame):
+    return '[' + ", ".join(map(str, self.value)) + ']'
+
+  def items(self, frame):
+    return map(Int, self.value)
+
+  def length(self):
+    return len(self.value)
+
+  def slice(self, start, end):
+    return IntArray(self.value[start:end])
+
+  def elementwise(self, op, other):
+    if isinstance(other, IntArray):
+      assert len(self.value) == len(other.value), \
+        "arrays should have the same length"
+      right = other.value
+    else:
+      right = repeat(other.value)
+    try:
+      return IntArray(map(op, self.value, right))
+    except OverflowError:
+      return Array([Int(op(a, b)) for a, b in zip(self.value, right)])
+
+  def Add(self, other):
+    return self.elementwise(operator.add, other)
+
+  def Sub(self, other):
+    return self.elementwise(operator.sub, other)
+
+  def Mul(self, other):
+    return self.elementwise(operator.mul, other)
+
+  def Pow(self, other):
+    return self.elementwise(operator.pow, other)
+
+  def Eq(self, other):
+    return Bool(self.value == other.value)
+
+  def Subscript(self, idx):
+    return Int(self.value[idx.to_int()])
+
+
+class Stream(Value):
+  """ Lazy sequence of values. Elements are produced on
+      demand, so a stream can be consumed only once.
+  """
+  def items(self, frame):
+    return self.value
+
+  def length(self):
+    return sum(1 for _ in self.value)
+
+  def slice(self, start, end):
+    return Stream(islice(self.value, start, end))
+
+  def to_string(self, frame):
+    return '[' + ", ".join(x.to_string(frame) for x in self.value) + ']'
 
 
 class Bool(Value):
@@ -180,17 +411,105 @@ class Bool(Value):
 
 @replaces(ast.RegEx)
 class RegEx(Value):
+  """ Regular expressions are compiled once. Patterns that start
+      with plain text are checked with str.startswith first and
+      those that are plain text do not get to the regex engine.
+  """
+  compiled = None
+  binary = None  # the pattern for mapped bytes (see MappedStr)
+
+  def compile(self):
+    self.prefix, self.literal = literal_prefix(self.value)
+    self.compiled = re.compile(self.value)
+    self.binary = binary_pattern(self.value)
+
   def RegMatch(self, string, frame):
-    m = re.match(self.value, string.to_string(frame))
+    if self.compiled is None:
+      self.compile()
+    if self.binary is not None and type(string) is MappedStr and string.matches_bytes():
+      m = self.binary.match(string.buf, string.start, string.end)
+      if not m:
+        return Bool(False)
+      return match_result(m, frame, buf=string.buf)
+    string = string.to_string(frame)
+    if not string.startswith(self.prefix):
+      return Bool(False)
+    if self.literal:
+      return Str(self.prefix) if self.prefix else Bool(True)
+    m = self.compiled.match(string)
     if not m:
       return Bool(False)
-    groupdict = m.groupdict()
-    if groupdict:
-      frame.update(groupdict)
-    group = m.group()
-    if group:
-      return Str(group)
-    return Bool(True)
+    return match_result(m, frame)
+
+
+def match_result(m, frame, group=0, names=None, buf=None):
+  """ Puts named groups into the frame and returns the matched text.
+      Groups of a match on a mapped buffer refer to the buffer.
+  """
+  if names is None:
+    names = m.re.groupindex
+  if names:
+    frame.update({k: matched(m, k, buf) for k in names})
+  if m.end(group) > m.start(group):
+    return matched(m, group, buf)
+  return Bool(True)
+
+
+def matched(m, group, buf):
+  if buf is None:
+    return Str(m.group(group) or "")
+  start, end = m.span(group)
+  return MappedStr(buf, start, end) if start >= 0 else Str("")
+
+
+def literal_prefix(pattern):
+  """ Returns plain text the pattern starts with and whether
+      the pattern is just that text.
+  """
+  try:
+    from re import _parser, _constants
+  except ImportError:
+    return "", False
+  parsed = _parser.parse(pattern)
+  if parsed.state.flags & (re.IGNORECASE | re.LOCALE):
+    return "", False
+  prefix = []
+  for op, av in parsed:
+    if op is not _constants.LITERAL:
+      break
+    prefix.append(chr(av))
+  return "".join(prefix), len(prefix) == len(parsed)
+
+
+def binary_pattern(pattern):
+  """ Compiles the pattern for matching bytes of mapped files, if it
+      matches the same there. Matching at an offset into a buffer
+      differs for ^ and \\A (they match only at its beginning) and
+      for lookbehinds (they see the previous line).
+  """
+  if not pattern.isascii():
+    return None
+  try:
+    from re import _parser, _constants
+  except ImportError:
+    return None
+  def lookback(parsed):
+    for op, av in parsed:
+      if op is _constants.AT and av in (_constants.AT_BEGINNING, _constants.AT_BEGINNING_STRING):
+        return True
+      if op in (_constants.ASSERT, _constants.ASSERT_NOT) and av[0] < 0:
+        return True
+      for x in av if isinstance(av, (tuple, list)) else ():
+        for sub in x if isinstance(x, list) else [x]:
+          if isinstance(sub, _parser.SubPattern) and lookback(sub):
+            return True
+    return False
+  if lookback(_parser.parse(pattern)):
+    return None
+  try:
+    return re.compile(pattern.encode())
+  except re.error:
+    return None
 
 
 @replaces(ast.Id)
@@ -203,8 +522,11 @@ class Var(Leaf):
       ref = lvalue
       frame[self.value] = ref
     else:
-      ref = frame[self.value]
-    self.type = ref.type
+      try:
+        ref = frame[self.value]
+      except KeyError:
+        raise Exception("unknown variable \"%s\"" % self.value)
+    self.type = ref.type or ref.infer_type(frame)
     return self.type
 
   def Assign(self, value, frame):
@@ -218,16 +540,85 @@ class Var(Leaf):
     except KeyError:
       raise Exception("unknown variable \"%s\"" % self.value)
 
+  def raw(self, frame):
+    return self.eval(frame).value
+
   def __str__(self):
     return str(self.value)
 
 
+class InlineCache:
+  """ Remembers implementations of an operation for the operand
+      types seen by a node. The last pair is checked first
+      (monomorphic case), others are kept in a small table.
+  """
+  __slots__ = ['name', 'last', 'entries', 'hits', 'misses']
+  max_entries = 4
+
+  def __init__(self, name):
+    self.name = name
+    self.last = (None, None, None)  # (ltype, rtype, impl), written at once
+    self.entries = {}
+    self.hits = self.misses = 0
+    inline_caches.append(self)
+
+  def lookup(self, left, right, same_type_operands):
+    ltype, rtype = type(left), type(right)
+    try:
+      impl = self.entries[ltype, rtype]
+      self.hits += 1
+    except KeyError:
+      self.misses += 1
+      if same_type_operands and not compatible(ltype, rtype):
+        raise Exception("%s:" \
+        "left and right values should have the same type, " \
+        "got\n %s \nand\n %s instead" % (self.name, left, right))
+      assert hasattr(left, self.name), \
+        "%s (%s) does not support %s operation" % (left, ltype, self.name)
+      impl = getattr(ltype, self.name)
+      if len(self.entries) < self.max_entries:
+        self.entries[ltype, rtype] = impl
+    self.last = ltype, rtype, impl
+    return impl
+
+inline_caches = []
+
+
+def compatible(ltype, rtype):
+  """ Checks that operands of these types can be used together: their
+      types are the same (see same_type_as) or the left one broadcasts.
+  """
+  return getattr(ltype, 'same_type_as', ltype) is getattr(rtype, 'same_type_as', rtype) \
+         or getattr(ltype, 'broadcast', False)
+
+
+def ic_report():
+  """ Summarizes hit rates of inline caches by operation. """
+  hits, misses = Counter(), Counter()
+  for ic in inline_caches:
+    hits[ic.name] += ic.hits
+    misses[ic.name] += ic.misses
+  lines = []
+  for name in sorted(hits):
+    total = hits[name] + misses[name]
+    rate = 100.0 * hits[name] / total if total else 0.0
+    lines.append("%s: %s hits, %s misses (%.1f%%)" % (name, hits[name], misses[name], rate))
+  return "\n".join(lines)
+
+
 class BinOp(Binary):
   same_type_operands = True
   type = None
+  ic = None
   def infer_type(self, frame):
     ltype = self.left.infer_type(frame)
     rtype = self.right.infer_type(frame)
+    if Unknown in (ltype.ret, rtype.ret):
+      self.type = Type([ltype, rtype], Unknown)
+      return self.type
+    if getattr(ltype.ret, 'broadcast', False):
+      self.type = Type([ltype, rtype], ltype)
+      return self.type
     assert ltype.ret == rtype.ret, \
       "left and right types should have the same type." \
       " Got \"%s\" and \"%s\" respectively." % (ltype, rtype)
@@ -235,16 +626,16 @@ class BinOp(Binary):
     return self.type
 
   def eval(self, frame):
-    opname = self.__class__.__name__
     left = self.left.eval(frame)
     right = self.right.eval(frame)
-    if self.same_type_operands and type(left) != type(right):
-      raise Exception("%s:" \
-      "left and right values should have the same type, " \
-      "got\n %s \nand\n %s instead" % (self.__class__, left, right))
-    assert hasattr(left, opname), \
-      "%s (%s) does not support %s operation" % (left, type(left), opname)
-    return getattr(left, opname)(right)
+    ic = self.ic
+    if ic is None:
+      ic = self.ic = InlineCache(self.__class__.__name__)
+    ltype, rtype, impl = ic.last
+    if type(left) is ltype and type(right) is rtype:
+      ic.hits += 1
+      return impl(left, right)
+    return ic.lookup(left, right, self.same_type_operands)(left, right)
 
 
 class BoolOp(BinOp):
@@ -257,6 +648,8 @@ class BoolOp(BinOp):
 @replaces(ast.Lambda0)
 class Func0(Node):
   fields = ['body']
+  type = None
+  name = None  # of the variable it is assigned to (see name_functions)
 
   def infer_type(self, frame):
     body_t = self.body.infer_type(frame)
@@ -274,8 +667,30 @@ class Func0(Node):
 class Func(Node):
   fields = ['args', 'body']
   type = None
+  argtypes = None
+  name = None
+
+  def instantiate(self, argnodes, frame):
+    """ Infers the function type for the given arguments. Functions
+        are monomorphic: all calls should have the same argument types.
+    """
+    argtypes = [node.infer_type(frame).ret for node in argnodes]
+    assert len(self.args) == len(argtypes)
+    if self.argtypes is not None:
+      assert all(Unknown in (a, b) or a == b for a, b in zip(self.argtypes, argtypes)), \
+        "function is called with (%s) but was inferred for (%s)" % \
+        (", ".join(t.__name__ for t in argtypes), ", ".join(t.__name__ for t in self.argtypes))
+      return self.type or Type(argtypes, Unknown)  # recursive call
+    self.argtypes = argtypes
+    with frame as newframe:
+      for arg, node in zip(self.args, argnodes):
+        newframe[arg.value] = node
+      return self.infer_type(newframe)
 
   def infer_type(self, frame):
+    if self.argtypes is None:
+      # arguments are not known until the function is called
+      return Type(None, Func)
     argtypes = []
     for arg in self.args:
       argtypes.append(arg.infer_type(frame))
@@ -316,7 +731,12 @@ class Print(Unary):
 
   def eval(self, frame):
     r = self.arg.eval(frame)
-    print(r.to_string(frame))
+    out = output.out
+    if isinstance(r, Stream):
+      for x in r.items(frame):
+        out.write(x.to_string(frame))
+      return r
+    out.write(r.to_string(frame))
     return r
 
 
@@ -339,8 +759,17 @@ class Assert(Unary):
 @replaces(ast.RegMatch)
 class RegMatch(BinOp):
   same_type_operands = False
+  def infer_type(self, frame):
+    self.left.infer_type(frame)
+    self.right.infer_type(frame)
+    if isinstance(self.left, RegEx):
+      # named groups become variables (see match_result)
+      frame.update({name: Str("") for name in re.compile(self.left.value).groupindex})
+    self.type = Type(None, Bool)
+    return self.type
+
   def __init__(self, left, right):
-    if isinstance(left, (Str, ast.Str)):
+    if isinstance(left, (Str, ast.Str)) or isinstance(right, (RegEx, ast.RegEx)):
       left, right = right, left
     super().__init__(left, right)
 
@@ -393,6 +822,16 @@ class Pow(BinOp): pass
 @replaces(ast.Subscript)
 class Subscript(BinOp):
   same_type_operands = False
+  def infer_type(self, frame):
+    array_t = self.left.infer_type(frame)
+    idx_t = self.right.infer_type(frame)
+    assert array_t.ret in (Array, IntArray, Unknown), "only arrays support subscription"
+    assert idx_t.ret in (Int, Unknown), "array index should be Int"
+    if array_t.ret is Unknown:  # e.g., a result of collect
+      self.type = Type(None, Unknown)
+    else:
+      self.type = Type(None, array_t.args[0])
+    return self.type
 
 
 @replaces(ast.Parens)
@@ -405,18 +844,20 @@ class Parens(Unary):
   def eval(self, frame):
     return self.arg.eval(frame)
 
+  def raw(self, frame):
+    return self.arg.raw(frame)
+
 
 @replaces(ast.IfThen)
 class IfThen(ast.IfThen):
+  type = None
   def infer_type(self, frame):
-    iff_t  = self.iff.infer_type(frame)
-    print(iff_t)
-    assert iff_t.ret == Bool
+    self.iff.infer_type(frame)  # any value can be a condition, see eval()
     self.type = self.then.infer_type(frame)
     return self.type
 
   def eval(self, frame):
-    if self.iff.eval(frame):  # this should return Bool
+    if self.iff.eval(frame):
       return True, self.then.eval(frame)
     return False, 0
 
@@ -425,11 +866,11 @@ class IfThen(ast.IfThen):
 class IfElse(ast.IfElse):
   type = None
   def infer_type(self, frame):
-    assert self.iff.infer_type(frame).ret == Bool
+    self.iff.infer_type(frame)
     then_type = self.then.infer_type(frame)
     else_type = self.otherwise.infer_type(frame)
-    assert then_type == else_type
-    self.type = Type(Bool, else_type)
+    # branches of different types are fine for eval()
+    self.type = common(then_type, else_type)
     return self.type
 
   def eval(self, frame):
@@ -440,11 +881,11 @@ class IfElse(ast.IfElse):
 
 @replaces(ast.Match)
 class Match(Unary):
+  type = None
   def infer_type(self, frame):
-    for expr in self.arg:
-      expr_t = expr.infer_type(frame)
-      # TODO: check that all expressions have the same type
-    self.type = expr_t
+    types = [expr.infer_type(frame) for expr in self.arg]
+    self.type = common(*types)
+    return self.type
 
   def eval(self, frame):
     for expr in self.arg:
@@ -456,6 +897,166 @@ class Match(Unary):
         return result
 
 
+class RegExMatch(Match):
+  """ Match which arms test regular expressions against the same
+      variable. Patterns are combined into one alternation with a
+      named group per arm, so a single scan finds the winning arm
+      (regex alternation also takes the first alternative that
+      matches). A trailing "_" arm is taken when nothing matches.
+  """
+  type = None
+  subject = None
+  combined = None
+  arms = None      # group name -> arm, names of groups of the arm
+  default = None
+  prefixes = None  # plain text patterns start with, if all of them do
+
+  binary = None    # the combined pattern for mapped bytes
+
+  def eval(self, frame):
+    subject = self.subject.eval(frame)
+    m = buf = None
+    if self.binary is not None and type(subject) is MappedStr and subject.matches_bytes():
+      buf = subject.buf
+      m = self.binary.match(buf, subject.start, subject.end)
+    else:
+      string = subject.to_string(frame)
+      if self.prefixes is None or string.startswith(self.prefixes):
+        m = self.combined.match(string)
+    if m:
+      arm, names = self.arms[m.lastgroup]
+      match_result(m, frame, m.lastgroup, names, buf)
+      return arm.then.eval(frame)
+    if self.default:
+      return self.default.then.eval(frame)
+
+
+@visits(Match)
+def combine_regexes(node, depth):
+  """ Replaces eligible match blocks with RegExMatch. """
+  if type(node) is not Match:
+    return node
+  arms = list(node.arg)
+  default = None
+  if arms and isinstance(arms[-1], IfThen) and isinstance(arms[-1].iff, AlwaysTrue):
+    default = arms.pop()
+  if len(arms) < 2:
+    return node
+  for arm in arms:
+    if not isinstance(arm, IfThen) or type(arm.iff) is not RegMatch or \
+       not isinstance(arm.iff.left, RegEx) or not isinstance(arm.iff.right, Var) or \
+       arm.iff.right.value != arms[0].iff.right.value:
+      return node
+    # numbered groups would be renumbered in the combined pattern
+    if re.search(r"\\[1-9]|\(\?\(", arm.iff.left.value):
+      return node
+  patterns, table, prefixes = [], {}, []
+  for i, arm in enumerate(arms):
+    regex = arm.iff.left
+    regex.compile()
+    name = "_arm%s" % i
+    patterns.append("(?P<%s>%s)" % (name, regex.value))
+    table[name] = arm, list(regex.compiled.groupindex)
+    prefixes.append(regex.prefix)
+  try:
+    combined = re.compile("|".join(patterns))
+  except re.error:  # e.g., the same group name in two arms
+    return node
+  log.regex("combining", len(arms), "arms matched against", arms[0].iff.right)
+  new = RegExMatch(node.arg)
+  new.subject = arms[0].iff.right
+  new.combined = combined
+  new.arms = table
+  new.default = default
+  if all(arm.iff.left.binary is not None for arm in arms):
+    new.binary = re.compile("|".join(patterns).encode())
+  if all(prefixes):
+    new.prefixes = tuple(prefixes)
+  return new
+
+
+######################
+# UNBOXED ARITHMETIC #
+######################
+
+class NativeOp(Binary):
+  """ Operation on operands proven to be Int by type inference.
+      It works with python ints, only the outermost node of
+      an expression boxes the result.
+  """
+  op = None
+  box = Int
+  type = None
+
+  def raw(self, frame):
+    return self.op(self.left.raw(frame), self.right.raw(frame))
+
+  def eval(self, frame):
+    return self.box(self.op(self.left.raw(frame), self.right.raw(frame)))
+
+
+class Unbox(Unary):
+  """ Unboxes the result of an arbitrary Int expression. """
+  type = None
+  def raw(self, frame):
+    return self.arg.eval(frame).value
+
+  def eval(self, frame):
+    return self.arg.eval(frame)
+
+
+@replaces(Add, unboxMap)
+class NativeAdd(NativeOp):
+  op = operator.add
+
+@replaces(Sub, unboxMap)
+class NativeSub(NativeOp):
+  op = operator.sub
+
+@replaces(Mul, unboxMap)
+class NativeMul(NativeOp):
+  op = operator.mul
+
+@replaces(Pow, unboxMap)
+class NativePow(NativeOp):
+  op = operator.pow
+
+@replaces(Eq, unboxMap)
+class NativeEq(NativeOp):
+  op = operator.eq
+  box = Bool
+
+@replaces(Less, unboxMap)
+class NativeLess(NativeOp):
+  op = operator.lt
+  box = Bool
+
+@replaces(More, unboxMap)
+class NativeMore(NativeOp):
+  op = operator.gt
+  box = Bool
+
+
+def unboxed(node):
+  if isinstance(node, Parens):
+    return unboxed(node.arg)
+  if isinstance(node, (Int, Var, NativeOp)):
+    return node
+  return Unbox(node)
+
+
+@visits(*unboxMap)
+def unbox(node, depth):
+  """ Replaces operations on proven ints with unboxed ones. """
+  newCls = unboxMap.get(type(node))
+  if not newCls or not (is_int(node.left) and is_int(node.right)):
+    return node
+  log.unbox("unboxing", node)
+  native = newCls(unboxed(node.left), unboxed(node.right))
+  native.type = node.type
+  return native
+
+
 ###########
 # SPECIAL #
 ###########
@@ -470,6 +1071,10 @@ class Return(Leaf):
 
 @replaces(ast.AlwaysTrue)
 class AlwaysTrue(Value):
+  def infer_type(self, frame):
+    self.type = Type(None, Bool)
+    return self.type
+
   def Bool(self, frame):
     return Bool(True)
 
@@ -486,8 +1091,9 @@ class Comment(Value):
 
 @replaces(ast.Call0)
 class Call0(Unary):
+  type = None
   def infer_type(self, frame):
-    self.type = self.arg.infer_type(frame)
+    self.type = Type(None, self.arg.infer_type(frame))
     return self.type
 
   def eval(self, frame):
@@ -499,23 +1105,49 @@ class Call0(Unary):
 @replaces(ast.Call)
 class Call(Binary):
   fields = ['func', 'args']
+  argnodes = None
+  type = None
+
+  def unpack_args(self):
+    # arity of a call site never changes, so unpack arguments only once
+    if isinstance(self.args, Array):
+      self.argnodes = tuple(self.args)
+    else:
+      self.argnodes = (self.args,)
+    return self.argnodes
+
+  def infer_type(self, frame):
+    func = self.func
+    if isinstance(func, Var):
+      try:
+        func = frame[func.value]
+      except KeyError:
+        raise Exception("unknown function \"%s\"" % func.value)
+    elif isinstance(func, Parens):
+      func = func.arg
+    assert hasattr(func, 'instantiate'), "%s is not a function" % self.func
+    self.type = Type(None, func.instantiate(self.argnodes or self.unpack_args(), frame))
+    return self.type
+
   def eval(self, frame):
+    argnodes = self.argnodes or self.unpack_args()
     with frame as newframe:
       func = self.func.eval(frame)
-      args = self.args.eval(frame)
-      if isinstance(args, (Value, Var)):
-        """ this is just to be able to iterate over func
-            args
-        """
-        args = [args]
-      assert len(func.args) == len(args)
-      for k, v in zip(func.args, args):
-        v =v.eval(frame)  # TODO: Why need extra eval??
-        if isinstance(v, ast.Int): v = Int(v.value) # dirty hack to overcome parser bug
-        newframe[k.value] = v
+      assert len(func.args) == len(argnodes)
+      for k, v in zip(func.args, argnodes):
+        newframe[k.value] = v.eval(frame)
       return func.Call(newframe)
 
 
+def apply(func, values, frame):
+  """ Calls a function with already evaluated arguments. """
+  assert len(func.args) == len(values)
+  with frame as newframe:
+    for k, v in zip(func.args, values):
+      newframe[k.value] = v
+    return func.Call(newframe)
+
+
 def fix_main_signature(main):
   """ Force main() to return Int. """
   if main.type.ret == Int:
@@ -528,50 +1160,932 @@ def fix_main_signature(main):
   main.body = body
 
 
+###############
+# MEMOIZATION #
+###############
+
+MEMO_SIZE = 1024
+memo_funcs = []
+
+
+def check_purity(func, frame):
+  """ Memoized functions cannot have side effects: shell commands,
+      I/O builtins and printing, in their bodies or in functions they
+      call, or assignments to outer variables.
+  """
+  local = set(arg.value for arg in func.args)
+  outer = set(frame.keys())
+  for node in walk(func.body):
+    if isinstance(node, Assign) and isinstance(node.left, Var):
+      name = node.left.value
+      if name in outer and name not in local:
+        raise Exception("memoized function is not pure: " \
+                        "it assigns to outer variable \"%s\"" % name)
+  for node in reachable(func.body, frame):
+    if isinstance(node, (ShellCmd, Print)):
+      raise Exception("memoized function is not pure: it uses %s" % node)
+    if isinstance(node, Var):
+      value = frame.get(node.value)
+      if isinstance(value, Builtin) and value.blocking:
+        raise Exception("memoized function is not pure: it calls %s" % value.name)
+
+
+def memo_key(value):
+  """ Values are compared by contents. Others (e.g., arrays
+      or functions) make the key unhashable.
+  """
+  if value is None:  # the variable is not bound
+    return None
+  return type(value), value.value
+
+
+class MemoFunc(Value):
+  """ Pure function with LRU cache of results keyed on values of
+      arguments and of variables it reads from outer frames (scoping
+      is dynamic, so they can differ between calls). The function is
+      checked and its outer variables are found on the first call,
+      when functions it calls are defined. Streams can be consumed
+      once, so their elements are cached instead.
+  """
+  def __init__(self, func, size=None):
+    super().__init__(func)
+    self.args = func.args
+    self.size = size or MEMO_SIZE
+    self.cache = OrderedDict()
+    self.hits = self.misses = 0
+    self.outer = None
+    memo_funcs.append(self)
+
+  def instantiate(self, argnodes, frame):
+    return self.value.instantiate(argnodes, frame)
+
+  def find_outer(self, frame):
+    check_purity(self.value, frame)
+    names, _ = reads(self.value.body, frame)
+    functions = (Func, Func0, MemoFunc, Builtin)
+    self.outer = tuple(sorted(name for name in names
+                              if not isinstance(frame.get(name), functions)))
+
+  def Call(self, frame):
+    if self.outer is None:
+      self.find_outer(frame)
+    try:
+      key = tuple(memo_key(frame[arg.value]) for arg in self.args) + \
+            tuple(memo_key(frame.get(name)) for name in self.outer)
+      hash(key)
+    except (TypeError, AttributeError):
+      return self.value.Call(frame)
+    try:
+      r = self.cache[key]
+      self.cache.move_to_end(key)
+      self.hits += 1
+      return Stream(iter(r)) if type(r) is tuple else r
+    except KeyError:
+      self.misses += 1
+    r = self.value.Call(frame)
+    if isinstance(r, Stream):
+      items = tuple(r.items(frame))
+      self.cache[key], r = items, Stream(iter(items))
+    else:
+      self.cache[key] = r
+    if len(self.cache) > self.size:
+      self.cache.popitem(last=False)
+    return r
+
+  def to_string(self, frame):
+    return "<memo (%s)>" % ", ".join(arg.value for arg in self.args)
+
+
+@replaces(ast.Memo)
+class Memo(Unary):
+  """ Evaluates to the same MemoFunc (and its cache) every time. """
+  type = None
+  memo = None
+
+  def infer_type(self, frame):
+    self.type = self.arg.infer_type(frame)
+    return self.type
+
+  def instantiate(self, argnodes, frame):
+    return self.arg.instantiate(argnodes, frame)
+
+  def eval(self, frame):
+    func = self.arg.eval(frame)
+    assert isinstance(func, Func), "only functions can be memoized"
+    if self.memo is None or self.memo.value is not func:
+      self.memo = MemoFunc(func)
+    return self.memo
+
+
+def memo_report():
+  """ Summarizes hit rates of memoized functions. """
+  lines = []
+  for i, f in enumerate(memo_funcs, 1):
+    total = f.hits + f.misses
+    rate = 100.0 * f.hits / total if total else 0.0
+    lines.append("#%s %s: %s hits, %s misses (%.1f%%), %s cached" % \
+                 (i, f.to_string(None), f.hits, f.misses, rate, len(f.cache)))
+  return "\n".join(lines)
+
+
 ##########################
 # Higher-Order Functions #
 ##########################
 
 @replaces(ast.ComposeR)
 class ComposeR(Binary):
+  type = None
+  def infer_type(self, frame):
+    self.type = Call(self.left, self.right).infer_type(frame)
+    return self.type
+
   def eval(self, frame):
     right = self.right.eval(frame)
     left = self.left.eval(frame)
-    return Call(left, right).eval(frame)
+    return apply(left, [right], frame)
+
+
+@replaces(ast.ComposerL)
+class ComposerL(Binary):
+  """ Passes the left value to the right function,
+      e.g., "x $ f $ g" is the same as "g f x".
+  """
+  type = None
+  def infer_type(self, frame):
+    self.type = Call(self.right, self.left).infer_type(frame)
+    return self.type
+
+  def eval(self, frame):
+    left = self.left.eval(frame)
+    right = self.right.eval(frame)
+    return apply(right, [left], frame)
+
+
+
+#####################
+# BUILT-IN FUNCTIONS #
+#####################
+
+builtin_funcs = OrderedDict()
+
+
+class Builtin(Value):
+  """ Function implemented in python. It gets the
+      frame and values of its arguments.
+  """
+  def __init__(self, name, f, args, ret, blocking=False):
+    super().__init__(f)
+    self.name = name
+    self.args = [Var(arg) for arg in args]
+    self.ret = ret
+    self.blocking = blocking
+
+  def instantiate(self, argnodes, frame):
+    for node in argnodes:
+      node.infer_type(frame)
+    return Type(None, self.ret)
+
+  def Call(self, frame):
+    return self.value(frame, *[frame[arg.value] for arg in self.args])
+
+  def to_string(self, frame):
+    return "<builtin %s>" % self.name
+
+
+class builtin:
+  """ Decorator to register built-in functions. Blocking ones
+      wait for I/O (see eval_toplevel).
+  """
+  def __init__(self, name, *args, ret=Unknown, blocking=False):
+    self.name = name
+    self.args = args
+    self.ret = ret
+    self.blocking = blocking
+
+  def __call__(self, f):
+    builtin_funcs[self.name] = Builtin(self.name, f, self.args, self.ret, self.blocking)
+    return f
+
+
+def to_array(values):
+  """ Makes an IntArray of Int values that fit in 64 bits. """
+  if all(type(v) is Int for v in values):
+    try:
+      return IntArray(v.value for v in values)
+    except OverflowError:
+      pass
+  return Array(values)
 
 
+@builtin('len', 'array', ret=Int)
+def builtin_len(frame, array):
+  return Int(array.length())
 
-def run(ast, args=['<progname>'], check_types=False):
-  ast = rewrite(ast, replace_nodes)
-  log.final_ast("the final AST is:\n", ast)
 
+@builtin('slice', 'array', 'start', 'end')
+def builtin_slice(frame, array, start, end):
+  return array.slice(start.to_int(), end.to_int())
+
+
+@builtin('map', 'func', 'array')
+def builtin_map(frame, func, array):
+  if isinstance(array, Stream):
+    # streams are evaluated later, they see variables as they are now
+    env = frame.snapshot()
+    return Stream(apply(func, [x], env) for x in array.items(frame))
+  return to_array([apply(func, [x], frame) for x in array.items(frame)])
+
+
+@builtin('filter', 'func', 'array')
+def builtin_filter(frame, func, array):
+  env = frame.snapshot() if isinstance(array, Stream) else frame
+  result = (x for x in array.items(frame) if apply(func, [x], env))
+  if isinstance(array, Stream):
+    return Stream(result)
+  return to_array(list(result))
+
+
+@builtin('take', 'n', 'array', ret=Stream)
+def builtin_take(frame, n, array):
+  return Stream(islice(array.items(frame), n.to_int()))
+
+
+@builtin('collect', 'array')
+def builtin_collect(frame, array):
+  return to_array(list(array.items(frame)))
+
+
+@builtin('range', 'start', 'end', ret=Stream)
+def builtin_range(frame, start, end):
+  return Stream(map(Int, range(start.to_int(), end.to_int())))
+
+
+def file_lines(path):
+  with open(path) as fd:
+    for line in fd:
+      yield Str(line.rstrip('\n'))
+
+
+def shell_lines(cmd):
+  from subprocess import Popen, PIPE
+  import shlex
+  proc = Popen(shlex.split(cmd), stdout=PIPE)
+  try:
+    for line in proc.stdout:
+      yield Str(line.decode().rstrip('\n'))
+  finally:
+    proc.stdout.close()
+    proc.wait()
+
+
+def map_file(path):
+  """ Maps the file into memory for reading. """
+  import mmap
+  import os
+  with open(path, 'rb') as fd:
+    if os.fstat(fd.fileno()).st_size == 0:
+      return b""  # empty files cannot be mapped
+    return mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def mapped_lines(buf):
+  if hasattr(buf, 'madvise'):
+    import mmap
+    buf.madvise(mmap.MADV_SEQUENTIAL)
+  start, size = 0, len(buf)
+  find = buf.find
+  while start < size:
+    end = find(b'\n', start)
+    if end < 0:
+      end = size
+    yield MappedStr(buf, start, end)
+    start = end + 1
+
+
+@builtin('lines', 'path', ret=Stream, blocking=True)
+def builtin_lines(frame, path):
+  return Stream(file_lines(path.to_string(frame)))
+
+
+@builtin('mlines', 'path', ret=Stream, blocking=True)
+def builtin_mlines(frame, path):
+  return Stream(mapped_lines(map_file(path.to_string(frame))))
+
+
+@builtin('mread', 'path', ret=Str, blocking=True)
+def builtin_mread(frame, path):
+  buf = map_file(path.to_string(frame))
+  return MappedStr(buf, 0, len(buf))
+
+
+@builtin('pipe', 'cmd', ret=Stream, blocking=True)
+def builtin_pipe(frame, cmd):
+  return Stream(shell_lines(cmd.to_string(frame)))
+
+
+@builtin('fold', 'func', 'init', 'array')
+def builtin_fold(frame, func, init, array):
+  acc = init
+  for x in array.items(frame):
+    acc = apply(func, [acc, x], frame)
+  return acc
+
+
+###########
+# INLINER #
+###########
+
+INLINE_MAX_NODES = 16
+
+
+def is_inlinable(node):
+  """ Checks that the node neither calls anything nor
+      touches the frame (except for reading variables).
+  """
+  for n in walk(node):
+    if isinstance(n, (Assign, RegMatch, ShellCmd, RegEx)):
+      return False
+    if isinstance(n, Str) and n.template:
+      return False
+    if not isinstance(n, (Value, Var, BinOp, Parens, IfElse, Block)):
+      return False
+  return True
+
+
+def is_constant(node):
+  """ Checks that evaluating the node can neither fail nor have effects. """
+  return type(node) in (Int, Bool, RegEx) or (type(node) is Str and not node.template)
+
+
+def inline_candidates(tree, shadowed=()):
+  """ Finds small functions that are safe to inline. A function is
+      a candidate if its name is assigned exactly once and never
+      shadowed by an argument or a named regex group.
+  """
+  assigned = Counter()
+  shadowed = set(shadowed)
+  funcs = {}
+  for node in walk(tree):
+    if isinstance(node, Assign) and isinstance(node.left, Var):
+      assigned[node.left.value] += 1
+      if isinstance(node.right, (Func, Func0)):
+        funcs[node.left.value] = node.right
+    elif isinstance(node, Func):
+      shadowed.update(arg.value for arg in node.args)
+    elif isinstance(node, RegEx):
+      shadowed.update(re.compile(node.value).groupindex)
+  return {name: func for name, func in funcs.items()
+          if assigned[name] == 1 and name not in shadowed
+          and sum(1 for _ in walk(func.body)) <= INLINE_MAX_NODES
+          and is_inlinable(func.body)}
+
+
+@visits(Var)
+def substitute(node, depth, params):
+  if isinstance(node, Var) and node.value in params:
+    return clone(params[node.value])
+  return node
+
+
+@visits(Call, Call0)
+def inline_calls(node, depth, funcs):
+  """ Replaces calls of small functions with their bodies,
+      arguments are substituted in place of variables.
+  """
+  if isinstance(node, Call0):
+    func = funcs.get(getattr(node.arg, 'value', None))
+    if not isinstance(func, Func0):
+      return node
+    log.inline("inlining", node)
+    return clone(func.body)
+
+  if not isinstance(node, Call) or not isinstance(node.func, Var):
+    return node
+  func = funcs.get(node.func.value)
+  if not isinstance(func, Func):
+    return node
+  argnodes = list(node.args) if isinstance(node.args, Array) else [node.args]
+  if len(func.args) != len(argnodes):
+    return node
+  params, unused = {}, []
+  for arg, value in zip(func.args, argnodes):
+    uses = sum(1 for n in walk(func.body)
+               if isinstance(n, Var) and n.value == arg.value)
+    # complex arguments are not copied to avoid repeated evaluation
+    if not (is_constant(value) or isinstance(value, Var)) and \
+       (uses > 1 or not is_inlinable(value)):
+      return node
+    params[arg.value] = value
+    # arguments the body ignores are still evaluated, they can fail
+    if not uses and not is_constant(value):
+      unused.append(value)
+  log.inline("inlining", node)
+  body = clone(func.body)
+  if not isinstance(body, Node):
+    body = substitute(body, depth, params)
+  else:
+    body = rewrite(body, substitute, params=params)
+  return Block(*unused, body) if unused else body
+
+
+#########################
+# TOP-LEVEL SCHEDULING #
+#########################
+
+def reachable(node, frame):
+  """ Iterates over nodes of the expression and of bodies of the
+      functions it refers to by name (each function once).
+  """
+  stack, seen = [node], set()
+  while stack:
+    for n in walk(stack.pop()):
+      yield n
+      if isinstance(n, Var) and n.value not in seen:
+        seen.add(n.value)
+        value = frame.get(n.value)
+        if isinstance(value, MemoFunc):
+          value = value.value
+        if isinstance(value, (Func, Func0)):
+          stack.append(value.body)
+
+
+def reads(node, frame):
+  """ Returns names of variables the expression reads, including
+      those read by top-level functions it refers to, and whether
+      it waits for I/O (runs shell commands or blocking builtins).
+  """
+  names, local, blocking = set(), set(), False
+  for n in reachable(node, frame):
+    if isinstance(n, ShellCmd):
+      blocking = True
+    elif isinstance(n, Func):
+      local.update(arg.value for arg in n.args)
+    elif isinstance(n, Assign) and isinstance(n.left, Var):
+      local.add(n.left.value)
+    elif isinstance(n, RegEx):
+      local.update(re.compile(n.value).groupindex)
+    elif isinstance(n, Var) and n.value not in names:
+      names.add(n.value)
+      value = frame.get(n.value)
+      if isinstance(value, Builtin) and value.blocking:
+        blocking = True
+  return names - local, blocking
+
+
+def eval_toplevel(block, frame, jobs):
+  """ Evaluates top-level expressions. Right sides of assignments
+      that wait for I/O are evaluated in a pool of threads (other
+      work would be serialized by the GIL anyway) and bound in the
+      order of the program. An expression waits for assignments
+      it reads, for those that assign the same name and for those
+      that read the name it assigns. Other expressions wait for
+      everything before them since they can have side effects.
+      Assignments that match regexes are not moved to threads:
+      groups of a match are bound in the frame evaluating it.
+  """
+  from concurrent.futures import ThreadPoolExecutor
+  running = []  # (assignment, names it reads, future)
+  def join(cond):
+    for item in [r for r in running if cond(*r)]:
+      running.remove(item)
+      node, _, future = item
+      node.left.Assign(future.result(), frame)
+
+  with ThreadPoolExecutor(jobs) as pool:
+    for node in block:
+      if not (isinstance(node, Assign) and isinstance(node.left, Var)):
+        join(lambda *r: True)
+        node.eval(frame)
+        continue
+      name = node.left.value
+      names, blocking = reads(node.right, frame)
+      join(lambda n, r, _: n.left.value in names or n.left.value == name or name in r)
+      groups = any(isinstance(n, RegEx) for n in walk(node.right))
+      # names that are not bound yet are left to fail as they do sequentially
+      if blocking and not groups and all(n in frame for n in names):
+        log.schedule("evaluating", name, "in background")
+        running.append((node, names, pool.submit(node.right.eval, frame)))
+      else:
+        node.eval(frame)
+    join(lambda *r: True)
+
+
+################
+# PARALLEL MAP #
+################
+
+MAP_WORKERS = None  # number of processes, all cores by default
+MAP_CHUNK = None    # elements sent to a worker at once, chosen by length
+STREAM_CHUNK = 16   # ... and for streams which length is unknown
+
+worker = None  # function and frame rebuilt in every worker process
+
+
+def init_worker(payload):
+  global worker
+  import pickle
+  func, closure = pickle.loads(payload)
   frame = Frame()
-  ast.eval(frame)
-  log.topframe("the top frame is\n", frame)
+  frame.update(builtin_funcs)
+  frame.update(closure)
+  worker = func, frame
+  # lines buffered by the parent are not ours to write
+  output.out = output.Output(size=0)
 
-  if 'main' not in frame:
-    print("no main function defined, exiting")
-    return 0
 
-  # type inference
-  if check_types:
+def map_chunk(start, items):
+  func, frame = worker
+  results = []
+  for i, x in enumerate(items, start):
+    try:
+      results.append(apply(func, [x], frame))
+    except Exception as e:
+      raise Exception("pmap failed on element %s: %s" % (i, e))
+  return results
+
+
+def parallel_map(func, items, frame, chunk):
+  """ Applies the function to items in worker processes, results
+      are yielded in order. Deadscript uses dynamic scoping, so the
+      values of variables the function reads are sent along with it.
+  """
+  from concurrent.futures import ProcessPoolExecutor
+  from collections import deque
+  import multiprocessing
+  import pickle
+  import os
+  names, _ = reads(func.body, frame) if isinstance(func, Func) else (set(), False)
+  closure = {}
+  for name in names:
+    try:
+      value = frame[name]
+    except KeyError:
+      continue
+    if value is not builtin_funcs.get(name):
+      closure[name] = value
+  try:
+    payload = pickle.dumps((func, closure))
+  except Exception as e:
+    raise Exception("pmap cannot send the function to workers: %s" % e)
+  workers = MAP_WORKERS or os.cpu_count()
+  # workers are forked because deadscript's ast module shadows the standard one
+  context = multiprocessing.get_context('fork')
+
+  def results():
+    output.out.flush()  # forked workers get a copy of the buffer
+    pool = ProcessPoolExecutor(workers, mp_context=context,
+                               initializer=init_worker, initargs=(payload,))
+    it = iter(items)
+    window = deque()  # chunks being processed, in order
+    start, done = 0, False
+    try:
+      while True:
+        while not done and len(window) < 2*workers:
+          part = list(islice(it, chunk))
+          if not part:
+            done = True
+            break
+          window.append(pool.submit(map_chunk, start, part))
+          start += len(part)
+        if not window:
+          break
+        yield from window.popleft().result()
+    finally:
+      pool.shutdown(cancel_futures=True)
+  return results()
+
+
+@builtin('pmap', 'func', 'array')
+def builtin_pmap(frame, func, array):
+  if isinstance(array, Stream):
+    return Stream(parallel_map(func, array.items(frame), frame,
+                               MAP_CHUNK or STREAM_CHUNK))
+  import os
+  workers = MAP_WORKERS or os.cpu_count()
+  chunk = MAP_CHUNK or max(1, -(-array.length() // (4*workers)))
+  return to_array(list(parallel_map(func, array.items(frame), frame, chunk)))
+
+
+#####################
+# ASYNCHRONOUS I/O #
+#####################
+
+IO_TIMEOUT = None      # seconds a shell command may run
+IO_CONCURRENCY = 8     # commands and reads running at the same time
+
+io_pool = None
+io_pending = []
+
+
+class Pending:
+  """ Result of I/O started in the background. It is stored in
+      the frame and waited for when the variable is read.
+  """
+  def __init__(self, future):
+    self.future = future
+
+  def result(self):
+    return self.future.result()
+
+  def __getattr__(self, name):
+    return getattr(self.result(), name)
+
+
+def start_io(f, *args):
+  global io_pool
+  if io_pool is None:
+    from concurrent.futures import ThreadPoolExecutor
+    io_pool = ThreadPoolExecutor(IO_CONCURRENCY)
+  pending = Pending(io_pool.submit(f, *args))
+  io_pending.append(pending)
+  return pending
+
+
+def prefetch(stream):
+  return Stream(iter(list(stream.value)))
+
+
+class AsyncAssign(Assign):
+  """ Assignment that starts a shell command or a blocking builtin
+      and binds the variable without waiting for the result.
+  """
+  def eval(self, frame):
+    right = self.right
+    if isinstance(right, ShellCmd):
+      cmd = Str.eval(right, frame).to_string(frame)
+      value = start_io(run_command, cmd)
+    else:
+      value = right.eval(frame)
+      if isinstance(value, Stream):
+        value = start_io(prefetch, value)
+    self.left.Assign(value, frame)
+    return value
+
+
+class AwaitVar(Var):
+  """ Variable that waits for the result of background I/O. """
+  def eval(self, frame):
+    try:
+      value = frame[self.value]
+    except KeyError:
+      raise Exception("unknown variable \"%s\"" % self.value)
+    if type(value) is Pending:
+      return value.result()
+    return value
+
+
+def starts_io(node, frame):
+  if isinstance(node, ShellCmd):
+    return True
+  if isinstance(node, Call) and isinstance(node.func, Var):
+    func = frame.get(node.func.value)
+    return isinstance(func, Builtin) and func.blocking
+  return False
+
+
+@visits(Block)
+def async_assigns(block, depth, frame):
+  """ Assignments of I/O are made asynchronous unless they are
+      the last expression (i.e., the result) of the block. Arms of
+      match are covered when they are blocks, an arm that is just
+      an assignment is its result.
+  """
+  for i, node in enumerate(block[:-1]):
+    if type(node) is Assign and isinstance(node.left, Var) and \
+       starts_io(node.right, frame):
+      block[i] = ast.inherit(AsyncAssign(*node), node)
+  return block
+
+
+@visits(Var)
+def await_vars(var, depth):
+  return AwaitVar(var.value)
+
+
+def asyncify(tree, frame):
+  """ Independent I/O runs concurrently: shell commands and
+      blocking builtins assigned to variables are started at
+      once and waited for when the variables are used.
+  """
+  tree = rewrite(tree, async_assigns, frame=frame)
+  return rewrite(tree, await_vars)
+
+
+def wait_io():
+  """ Waits for I/O nobody read, its errors are not lost. """
+  while io_pending:
+    io_pending.pop(0).result()
+
+
+def stop_io():
+  """ Stops threads of background I/O when the program ends (also
+      when it fails), I/O that did not start yet is cancelled.
+  """
+  global io_pool
+  if io_pool is not None:
+    io_pool.shutdown(cancel_futures=True)
+    io_pool = None
+  del io_pending[:]
+
+
+code_positions = {}  # file name of generated code -> positions of its lines
+code_functions = {}  # code object of generated code -> function it runs
+
+
+def error_position(exc):
+  """ Returns (line, column) of the innermost node that was being
+      evaluated (or type-checked) when the exception was raised.
+      Nodes are found in the traceback, so evaluation is not slowed
+      down by keeping track of the current node.
+  """
+  pos = None
+  tb = exc.__traceback__
+  while tb:
+    lines = code_positions.get(tb.tb_frame.f_code.co_filename)
+    if lines:
+      pos = lines[tb.tb_lineno-1] or pos
+    node = tb.tb_frame.f_locals.get('self')
+    if isinstance(node, (Node, Leaf)):
+      pos = ast.position(node) or pos
+    tb = tb.tb_next
+  return pos
+
+
+############
+# BACKENDS #
+############
+
+passes = OrderedDict()    # name -> rewrite of the IR, in order of application
+backends = OrderedDict()  # name -> class executing the IR
+
+
+class ir_pass:
+  """ Decorator to register a pass over the IR. Passes run on every
+      program, whatever backend executes it (see lower).
+  """
+  def __init__(self, name):
+    self.name = name
+
+  def __call__(self, f):
+    passes[self.name] = f
+    return f
+
+
+class backend:
+  """ Decorator to register a backend. """
+  def __init__(self, name):
+    self.name = name
+
+  def __call__(self, cls):
+    cls.name = self.name
+    backends[self.name] = cls
+    return cls
+
+
+@ir_pass('inline')
+def inline_pass(tree):
+  funcs = inline_candidates(tree, shadowed=['argc', 'argv'])
+  return rewrite(tree, inline_calls, funcs=funcs)
+
+
+@ir_pass('regex')
+def regex_pass(tree):
+  return rewrite(tree, combine_regexes)
+
+
+@visits(Assign)
+def name_functions(node, depth):
+  """ Functions are named after variables they are assigned to. """
+  func = node.right
+  if isinstance(func, Memo):
+    func = func.arg
+  if isinstance(func, (Func, Func0)) and isinstance(node.left, Var):
+    func.name = node.left.value
+  return node
+
+
+def lower(ast, skip=()):
+  """ Turns the parsed program into the intermediate representation
+      shared by backends: syntax nodes are replaced by the nodes of
+      this module (see replaces) and then go through the passes.
+  """
+  ir = rewrite(ast, replace_nodes)
+  ir = rewrite(ir, name_functions)
+  for name, f in passes.items():
+    if name not in skip:
+      ir = f(ir)
+      log.passes("after", name, "pass:\n", ir)
+  return ir
+
+
+class Backend:
+  """ Executes the IR. run() returns the exit code of the program. """
+  name = None
+
+  def __init__(self, jobs=1, async_io=False, check_types=False):
+    self.jobs = jobs
+    self.async_io = async_io
+    self.check_types = check_types
+
+  def run(self, ir, args):
+    raise NotImplementedError("backend \"%s\" does not implement run()" % self.name)
+
+
+@backend('tree')
+class TreeBackend(Backend):
+  """ Walks the tree calling eval() of nodes. """
+  infer = False  # infer types even without --check-types
+
+  def run(self, ast, args):
+    frame = Frame()
+    frame.update(builtin_funcs)
+    if self.async_io:
+      ast = asyncify(ast, frame)
+    ast = self.prepare(ast)
+    log.final_ast("the final AST is:\n", ast)
+
+    try:
+      if self.jobs > 1:
+        eval_toplevel(ast, frame, self.jobs)
+      else:
+        ast.eval(frame)
+      log.topframe("the top frame is\n", frame)
+
+      if 'main' not in frame:
+        output.out.write("no main function defined, exiting")
+        return 0
+
+      if self.check_types or self.infer:
+        self.infer_types(ast, frame, args)
+
+      with frame as newframe:
+        newframe['argc'] = Int(len(args))
+        newframe['argv'] = Array(map(Str, args))
+        r = newframe['main'].Call(newframe)
+      if self.async_io:
+        wait_io()
+    finally:
+      if self.async_io:
+        stop_io()
+      output.out.flush()
+
+    if isinstance(r, Int):
+      return r.to_int()
+    else:
+      return 0
+
+  def infer_types(self, ast, frame, args):
     with frame as newframe:
-      newframe['argc'] = Int(len(args))
-      newframe['argv'] = Array(map(Str, args))
       main = newframe['main']
-      main.infer_type(newframe)
-      if main.type.ret != Int:
+      main.instantiate([Int(len(args)), Array(map(Str, args))], newframe)
+      if self.check_types and main.type.ret != Int:
         # print("main() should return Int but got %s" % main.type.ret)
         # print("so it will be fixed to return 0")
         fix_main_signature(main)
+    # use inferred types to get rid of boxing in arithmetic
+    rewrite(ast, unbox)
 
+  def prepare(self, ast):
+    return ast
 
-  with frame as newframe:
-    newframe['argc'] = Int(len(args))
-    newframe['argv'] = Array(map(Str, args))
-    r = newframe['main'].Call(newframe)
 
-  if isinstance(r, Int):
-    return r.to_int()
-  else:
-    return 0
+@backend('unboxed')
+class UnboxedBackend(TreeBackend):
+  """ Tree walker that always infers types, so arithmetic proven to
+      be on Int works with python ints. Unlike --check-types, it keeps
+      main() as it is.
+  """
+  infer = True
+
+  def infer_types(self, ast, frame, args):
+    # programs inference cannot type still run (like on the tree
+    # backend, errors in them are reported when they are evaluated)
+    try:
+      super().infer_types(ast, frame, args)
+    except Exception as e:
+      if self.check_types:
+        raise
+      log.unbox("running boxed, types cannot be inferred:", e)
+
+
+@backend('python')
+class PythonBackend(TreeBackend):
+  """ Runs bodies of functions compiled to python code. """
+  def prepare(self, ast):
+    from compiler import compile_functions  # it imports this module
+    return compile_functions(ast)
+
+
+def run(ast, args=['<progname>'], check_types=False, inline=True, jobs=1,
+        async_io=False, backend='tree', skip=()):
+  if backend not in backends:
+    raise Exception("unknown backend \"%s\", available: %s" % (backend, ", ".join(backends)))
+  if not inline:
+    skip = tuple(skip) + ('inline',)
+  # tables of the previous run (e.g., with --watch) refer to its nodes
+  del inline_caches[:]
+  del memo_funcs[:]
+  code_positions.clear()
+  code_functions.clear()
+  ir = lower(ast, skip)
+  return backends[backend](jobs, async_io, check_types).run(ir, args)
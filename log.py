@@ -1,5 +1,4 @@
 #!/usr/bin/env python3
-from termcolor import colored
 from fnmatch import fnmatch
 from copy import copy
 import sys
@@ -46,6 +45,7 @@ class Log:
 
   def log(self, *msg):
     if logfilter.test(self.path):
+      from termcolor import colored  # loaded only when something is logged
       style = styles['debug']
       msg = '.'.join(self.path)+': '+" ".join(str(m) for m in msg)
       print(colored(msg, **style), file=sys.stderr)
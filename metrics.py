@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Runtime metrics (see --metrics). Counters are kept by wrappers that
+enable() puts around constructors and calls of the interpreter, so
+programs run without them unless metrics are requested. Counters
+are not locked (except for shell commands), with several threads
+(-j, --async-io) they are approximate.
+"""
+from frame import Frame
+from time import perf_counter
+import threading
+import interpreter
+import json
+
+counters = {
+  'frames': 0,              # Frame objects created
+  'max_depth': 0,           # the deepest frame
+  'calls': 0,               # calls of functions (f x and f!)
+  'Int': 0,                 # values allocated
+  'Str': 0,
+  'Bool': 0,
+  'shell_commands': 0,
+  'shell_seconds': 0.0,     # time spent waiting for shell commands
+  'regex_compilations': 0,
+}
+
+descriptions = {
+  'frames': ("counter", "frames created"),
+  'max_depth': ("gauge", "depth of the deepest frame"),
+  'calls': ("counter", "function calls"),
+  'values': ("counter", "values allocated"),
+  'shell_commands': ("counter", "shell commands run"),
+  'shell_seconds': ("counter", "seconds spent in shell commands"),
+  'regex_compilations': ("counter", "regular expressions compiled"),
+}
+
+shell_lock = threading.Lock()
+enabled = False
+
+
+def counting(f, name):
+  def wrapper(*args, **kwargs):
+    counters[name] += 1
+    return f(*args, **kwargs)
+  return wrapper
+
+
+def enable():
+  """ Installs the counters. """
+  global enabled
+  if enabled:
+    return
+  enabled = True
+
+  frame_init = Frame.__init__
+  def init_frame(self, parent=None):
+    frame_init(self, parent)
+    counters['frames'] += 1
+    if self.depth > counters['max_depth']:
+      counters['max_depth'] = self.depth
+  Frame.__init__ = init_frame
+
+  for cls in (interpreter.Int, interpreter.Str, interpreter.Bool):
+    cls.__init__ = counting(cls.__init__, cls.__name__)
+  for cls in (interpreter.Call, interpreter.Call0):
+    cls.eval = counting(cls.eval, 'calls')
+  interpreter.RegEx.compile = counting(interpreter.RegEx.compile, 'regex_compilations')
+
+  run_command = interpreter.run_command
+  def timed_command(cmd):
+    start = perf_counter()
+    try:
+      return run_command(cmd)
+    finally:
+      with shell_lock:
+        counters['shell_commands'] += 1
+        counters['shell_seconds'] += perf_counter() - start
+  interpreter.run_command = timed_command
+
+  # generated code gets these from the module when it is compiled
+  import compiler
+  compiler.run_command = timed_command
+  compiler.box = counting(compiler.box, 'Int')
+  compiler.call = counting(compiler.call, 'calls')
+  compiler.call0 = counting(compiler.call0, 'calls')
+
+
+def snapshot():
+  """ Returns current values of the counters. """
+  return dict(counters)
+
+
+def to_json():
+  return json.dumps(snapshot(), indent=2, sort_keys=True)
+
+
+def to_prometheus():
+  """ Formats counters in the text format of Prometheus. """
+  values = snapshot()
+  lines = []
+  for name, (kind, text) in descriptions.items():
+    metric = "deadscript_%s%s" % (name, "_total" if kind == "counter" else "")
+    lines.append("# HELP %s %s" % (metric, text))
+    lines.append("# TYPE %s %s" % (metric, kind))
+    if name == 'values':
+      for t in ('Int', 'Str', 'Bool'):
+        lines.append('%s{type="%s"} %s' % (metric, t, values[t]))
+    else:
+      lines.append("%s %s" % (metric, values[name]))
+  return "\n".join(lines) + "\n"
+
+
+formats = {'json': to_json, 'prometheus': to_prometheus}
+
+
+def dump(path, fmt='json'):
+  """ Writes the counters to the file, "-" is stderr. """
+  text = formats[fmt]()
+  if path == '-':
+    import sys
+    sys.stderr.write(text if text.endswith("\n") else text + "\n")
+    return
+  with open(path, 'w') as fd:
+    fd.write(text)
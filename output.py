@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Output of programs (the p operator). Lines are collected and written
+in batches instead of calling print() for every one of them. The
+output is flushed when the buffer is full, when the program exits
+and before an error is reported. Output to a terminal is written
+line by line, like print() does.
+"""
+import atexit
+import sys
+import os
+
+BUFFER_SIZE = 1 << 16  # characters collected before they are written
+
+
+class Output:
+  """ Buffered output to a stream. Streams with an underlying binary
+      buffer (like sys.stdout) get encoded bytes directly.
+  """
+  def __init__(self, stream=None, size=None):
+    self.stream = stream
+    if size is None:
+      isatty = getattr(stream or sys.stdout, 'isatty', None)
+      size = 0 if isatty and isatty() else BUFFER_SIZE
+    self.size = size
+    self.lines = []
+    self.pending = 0
+
+  def write(self, line):
+    self.lines.append(line)
+    self.pending += len(line) + 1
+    if self.pending > self.size:
+      self.flush()
+
+  def flush(self):
+    if not self.lines:
+      return
+    lines, self.lines, self.pending = self.lines, [], 0
+    lines.append("")
+    self.write_data("\n".join(lines))
+
+  def write_data(self, data):
+    stream = self.stream or sys.stdout
+    buf = getattr(stream, 'buffer', None)
+    if buf is None:
+      stream.write(data)
+      stream.flush()
+    else:
+      stream.flush()  # text written by others goes first
+      buf.write(data.encode())
+      buf.flush()
+
+  def close(self):
+    self.flush()
+
+
+class MappedOutput(Output):
+  """ Output to a file mapped into memory. Space is preallocated
+      and doubled when it runs out, the file is truncated to the
+      written size when closed.
+  """
+  def __init__(self, path, size=BUFFER_SIZE, preallocate=1 << 20):
+    super().__init__(None, size)
+    self.fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o644)
+    self.map = None
+    self.capacity = self.offset = 0
+    self.grow(max(preallocate, 1))
+
+  def grow(self, capacity):
+    import mmap
+    if self.map:
+      self.map.close()
+    if hasattr(os, 'posix_fallocate'):
+      os.posix_fallocate(self.fd, 0, capacity)
+    else:
+      os.ftruncate(self.fd, capacity)
+    self.map = mmap.mmap(self.fd, capacity)
+    self.capacity = capacity
+
+  def write_data(self, data):
+    data = data.encode()
+    end = self.offset + len(data)
+    if end > self.capacity:
+      self.grow(max(end, 2*self.capacity))
+    self.map[self.offset:end] = data
+    self.offset = end
+
+  def close(self):
+    if self.map is None:
+      return
+    self.flush()
+    self.map.close()
+    self.map = None
+    os.ftruncate(self.fd, self.offset)
+    os.close(self.fd)
+
+
+out = Output()
+
+
+@atexit.register
+def close():
+  out.close()
@@ -9,31 +9,96 @@ from itertools import chain
 symap = {}
 
 
+class Symbol:
+  """ Operator token. There is only one instance per operator:
+      tokens are stateless, the parser state is kept in globals.
+      Parsing rules are plain data (kind, class, argument).
+  """
+  def __init__(self, sym, lbp=0):
+    self.sym = sym
+    self.lbp = lbp
+    self.nud_rule = None
+    self.led_rule = None
+
+  def __repr__(self):
+    return "Sym('%s')" % self.sym
+
+  def nud(self):
+    if not self.nud_rule:
+      raise SyntaxError("Unexpected %r" % self.sym)
+    kind, cls, arg = self.nud_rule
+    return nuds[kind](self, cls, arg)
+
+  def led(self, left):
+    if not self.led_rule:
+      raise SyntaxError("Unexpected %r" % self.sym)
+    kind, cls, arg = self.led_rule
+    return leds[kind](self, left, cls, arg)
+
+
 def symbol(sym, lbp=0):
   try:
     Sym = symap[sym]
   except KeyError:
-    class Sym: pass
-    Sym.__name__ = Sym.__qualname__ = "Sym('%s')" % sym
-    Sym.__repr__ = lambda _: "Sym('%s')" % sym
-    Sym.sym = sym
-    Sym.lbp = lbp
-    symap[sym] = Sym
+    Sym = symap[sym] = Symbol(sym, lbp)
   else:
     Sym.lbp = max(lbp, Sym.lbp)
   return Sym
 
 
+##################
+# PARSING RULES #
+##################
+
+def nud_prefix(self, cls, rbp):
+  return cls(expr(rbp))
+
+def nud_nullary(self, cls, _):
+  return cls(self.sym)
+
+def nud_brackets(self, cls, close):
+  e = expr()
+  advance(close)
+  return cls(e)
+
+def led_infix(self, left, cls, _):
+  return cls(left, expr(self.lbp))
+
+def led_infix_r(self, left, cls, _):
+  return cls(left, expr(self.lbp-1))
+
+def led_postfix(self, left, cls, _):
+  return cls(left)
+
+def led_subscript(self, left, cls, close):
+  right = expr()
+  if close:
+    advance(close)
+  return cls(left, right)
+
+def led_ifelse(self, left, cls, _):
+  then = left
+  iff = expr()
+  advance("else")
+  otherwise = expr()
+  return cls(iff, then, otherwise)
+
+nuds = {'prefix': nud_prefix, 'nullary': nud_nullary, 'brackets': nud_brackets}
+leds = {'infix': led_infix, 'infix_r': led_infix_r, 'postfix': led_postfix,
+        'subscript': led_subscript, 'ifelse': led_ifelse}
+
+
+##############
+# DECORATORS #
+##############
+
 class prefix:
   def __init__(self, sym, rbp):
     self.sym = sym
     self.rbp = rbp
 
   def __call__(self, cls):
-    rbp = self.rbp
-    def nud(self):
-      return cls(expr(rbp))
-    symbol(self.sym).nud = nud
+    symbol(self.sym).nud_rule = ('prefix', cls, self.rbp)
     return cls
 
 
@@ -43,9 +108,7 @@ class infix:
     self.lbp = lbp
 
   def __call__(self, cls):
-    def led(self, left):
-      return cls(left, expr(self.lbp))
-    symbol(self.sym, self.lbp).led = led
+    symbol(self.sym, self.lbp).led_rule = ('infix', cls, None)
     return cls
 
 
@@ -55,9 +118,7 @@ class infix_r:
     self.lbp = lbp
 
   def __call__(self, cls):
-    def led(self, left):
-      return cls(left, expr(self.lbp-1))
-    symbol(self.sym, self.lbp).led = led
+    symbol(self.sym, self.lbp).led_rule = ('infix_r', cls, None)
     return cls
 
 
@@ -67,9 +128,7 @@ class postfix:
     self.lbp = lbp
 
   def __call__(self, cls):
-    def led(self, left):
-      return cls(left)
-    symbol(self.sym, self.lbp).led = led
+    symbol(self.sym, self.lbp).led_rule = ('postfix', cls, None)
     return cls
 
 
@@ -79,9 +138,7 @@ class nullary:
     self.sym = sym
 
   def __call__(self, cls):
-    def nud(self):
-      return cls(self.sym)
-    symbol(self.sym).nud = nud
+    symbol(self.sym).nud_rule = ('nullary', cls, None)
     return cls
 
 
@@ -91,14 +148,8 @@ class brackets:
     self.close = close
 
   def __call__(self, cls):
-    open = self.open
-    close = self.close
-    def nud(self):
-      e = expr()
-      advance(close)
-      return cls(e)
-    symbol(open).nud = nud
-    symbol(close)
+    symbol(self.open).nud_rule = ('brackets', cls, self.close)
+    symbol(self.close)
     return cls
 
 
@@ -112,16 +163,9 @@ class subscript:
       self.open, self.close, self.lbp = args
 
   def __call__(self, cls):
-    open  = self.open
-    close = self.close
-    lbp   = self.lbp
-    def led(self, left):
-      right = expr()
-      if close:
-        advance(close)
-      return cls(left, right)
-    symbol(open, lbp=1000).led = led
-    symbol(close)
+    symbol(self.open, lbp=1000).led_rule = ('subscript', cls, self.close)
+    if self.close:
+      symbol(self.close)
     return cls
 
 
@@ -131,13 +175,7 @@ class ifelse:
     self.lbp = lbp
 
   def __call__(self, cls):
-    def led(self, left):
-      then = left
-      iff = expr()
-      advance("else")
-      otherwise = expr()
-      return cls(iff, then, otherwise)
-    symbol("if", lbp=self.lbp).led = led
+    symbol("if", lbp=self.lbp).led_rule = ('ifelse', cls, None)
     symbol("else")
     return cls
 
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Sampling profiler (see --sample). A background thread looks at the
+stack of the main thread at regular intervals and counts which
+deadscript functions and lines are running. The interpreter does
+not record anything for it, so programs run at full speed between
+samples. Profiles are written as folded stacks: one line per stack,
+frames separated by ";" and followed by the number of samples
+(the input of flamegraph.pl, speedscope and similar tools).
+"""
+from interpreter import Func, Func0, Builtin, code_positions, code_functions
+from ast import Node, Leaf, position
+import threading
+import atexit
+import sys
+
+INTERVAL = 0.01  # seconds between samples
+
+# methods that run functions, their "self" is the function
+entries = {Func.Call.__code__, Func0.Call.__code__, Builtin.Call.__code__}
+OTHER, ENTRY, GENERATED, METHOD = "other", "entry", "generated", "method"
+
+
+def classify(code):
+  if code in entries:
+    return ENTRY
+  if code in code_functions:
+    return GENERATED
+  if code.co_argcount and code.co_varnames[0] == 'self':
+    return METHOD  # may be a method of a node
+  return OTHER
+
+
+class Sampler:
+  """ Collects samples of the thread that started it. """
+  def __init__(self, path, source, interval=INTERVAL):
+    self.path = path
+    self.source = source    # path of the program for labels
+    self.interval = interval
+    self.counts = {}        # stack -> number of samples
+    self.functions = {}     # id -> function seen in stacks
+    self.kinds = {}         # code object -> its kind (see classify)
+    self.target = None
+    self.stopped = threading.Event()
+    self.thread = None
+
+  def start(self):
+    self.target = threading.get_ident()
+    self.thread = threading.Thread(target=self.loop, name="sampler", daemon=True)
+    self.thread.start()
+    atexit.register(self.stop)
+
+  def stop(self):
+    if self.stopped.is_set():
+      return
+    self.stopped.set()
+    self.thread.join()
+    self.dump()
+
+  def loop(self):
+    while not self.stopped.wait(self.interval):
+      frame = sys._current_frames().get(self.target)
+      if frame is None:
+        continue
+      stack = self.stack(frame)
+      self.counts[stack] = self.counts.get(stack, 0) + 1
+
+  def stack(self, frame):
+    """ Returns ((id of function, line), ...) from the outermost
+        call, the top level has no function. Frames are visited
+        from the innermost one, only until the line of the current
+        function is known.
+    """
+    kinds = self.kinds
+    stack = []
+    line = None
+    while frame is not None:
+      code = frame.f_code
+      kind = kinds.get(code)
+      if kind is None:
+        kind = kinds[code] = classify(code)
+      if kind is OTHER:
+        frame = frame.f_back
+        continue
+      if line is None:
+        if kind is GENERATED:
+          pos = code_positions[code.co_filename][frame.f_lineno-1]
+        elif kind is METHOD:
+          node = frame.f_locals.get('self')
+          pos = position(node) if isinstance(node, (Node, Leaf)) else None
+        else:
+          pos = None
+        line = pos and pos[0]
+      if kind is ENTRY or kind is GENERATED:
+        entry = frame.f_locals.get('self') if kind is ENTRY else code_functions[code]
+        # generated code is called by Func.Call sometimes, it is one call
+        if not (line is None and stack and stack[-1][0] == id(entry)):
+          self.functions[id(entry)] = entry
+          stack.append((id(entry), line))
+        line = None
+      frame = frame.f_back
+    stack.append((None, line))
+    return tuple(reversed(stack))
+
+  def label(self, key):
+    ident, line = key
+    func = self.functions.get(ident)
+    if func is None:
+      name = "<toplevel>"
+    elif isinstance(func, Builtin):
+      name = func.name
+    else:
+      pos = position(func)
+      name = func.name or "lambda@%s" % (pos[0] if pos else "?")
+    if line is None:
+      return name
+    return "%s (%s:%s)" % (name, self.source, line)
+
+  def dump(self):
+    """ Writes the profile collected so far. """
+    counts = dict(self.counts)
+    lines = []
+    for stack, n in counts.items():
+      lines.append("%s %s" % (";".join(self.label(key) for key in stack), n))
+    lines.sort()
+    with open(self.path, 'w') as fd:
+      fd.write("".join(line + "\n" for line in lines))
@@ -0,0 +1,79 @@
+"""
+Helpers for tests. Programs are run by dead.py in a separate process:
+the interpreter's ast module shadows the standard one, so it cannot be
+imported into the process of the test runner. Run the tests from this
+directory ("make test" does that).
+"""
+import subprocess
+import tempfile
+import sys
+import os
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+EXAMPLES = os.path.join(ROOT, "examples")
+TIMEOUT = 60
+
+
+class Result:
+  def __init__(self, proc):
+    self.code = proc.returncode
+    self.out = proc.stdout
+    self.err = proc.stderr
+
+  def __repr__(self):
+    return "Result(%s, out=%r, err=%r)" % (self.code, self.out, self.err)
+
+
+def environment(home):
+  """ The code cache of the python backend goes to the temporary home. """
+  env = dict(os.environ, HOME=home)
+  env.pop('PYTHONPATH', None)
+  return env
+
+
+def run_file(path, *flags, args=()):
+  """ Runs the program with dead.py. """
+  with tempfile.TemporaryDirectory() as home:
+    proc = subprocess.run([sys.executable, os.path.join(ROOT, "dead.py")] +
+                          list(flags) + [path] + list(args),
+                          capture_output=True, text=True, timeout=TIMEOUT,
+                          env=environment(home), cwd=home)
+  return Result(proc)
+
+
+def run(source, *flags, args=()):
+  """ Runs the program given as text. """
+  with tempfile.TemporaryDirectory() as tmp:
+    path = os.path.join(tmp, "test.ls")
+    with open(path, "w") as fd:
+      fd.write(source)
+    return run_file(path, *flags, args=args)
+
+
+def python(code):
+  """ Runs python code next to the modules of the interpreter
+      and returns what it printed.
+  """
+  with tempfile.TemporaryDirectory() as home:
+    proc = subprocess.run([sys.executable, "-c", code], capture_output=True,
+                          text=True, timeout=TIMEOUT, env=environment(home), cwd=ROOT)
+  if proc.returncode:
+    raise AssertionError("python code failed:\n%s" % proc.stderr)
+  return proc.stdout
+
+
+def write(directory, name, text):
+  path = os.path.join(directory, name)
+  with open(path, "w") as fd:
+    fd.write(text)
+  return path
+
+
+_backends = None
+
+def backends():
+  """ Names of all registered backends. """
+  global _backends
+  if _backends is None:
+    _backends = python("import interpreter\nprint(' '.join(interpreter.backends))").split()
+  return _backends
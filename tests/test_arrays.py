@@ -0,0 +1,42 @@
+"""
+Arrays of Int are kept in 64-bit IntArrays until a value does not fit.
+"""
+import unittest
+from support import run, backends
+
+PROGRAM = '''
+main = (argc, argv) ->
+  a = [2^70, 1]
+  p a
+  p [2^62, 2] * 4
+  p [3, 4] ^ 2
+  p [1, 2] + [10, 20]
+  p [5, 6] - 1
+  p len a
+  p a[0]
+  p (map ((x) -> x * x), [2^40, 3])
+  0
+'''
+
+OUTPUT = """\
+[1180591620717411303424, 1]
+[18446744073709551616, 8]
+[9, 16]
+[11, 22]
+[4, 5]
+2
+1180591620717411303424
+[1208925819614629174706176, 9]
+"""
+
+
+class TestArrays(unittest.TestCase):
+  def test_big_ints(self):
+    for backend in backends():
+      with self.subTest(backend=backend):
+        r = run(PROGRAM, "-b", backend)
+        self.assertEqual((r.code, r.out), (0, OUTPUT), r.err)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,58 @@
+"""
+With --async-io, shell commands and reads assigned to variables run in
+the background. Programs should print the same as without it.
+"""
+import unittest
+from support import run, python, EXAMPLES
+import os
+
+PROGRAM = '''
+lower = (s) -> `echo {s}`
+main = (argc, argv) ->
+  a = `echo one`
+  b = `echo two`
+  match
+    argc == 1 =>
+      c = lower "three"
+      d = `echo four`
+      p c + d
+    _ => p "other"
+  p a + b
+  e = collect (lines "%s")
+  p len e
+  0
+''' % os.path.join(EXAMPLES, "hello.ls")
+
+TIMEOUT = '''
+import threading
+from log import logfilter
+logfilter.default = False
+from tokenizer import tokenize
+from indent import parse as indent_parse
+from ast import parse
+import interpreter
+interpreter.IO_TIMEOUT = 0.2
+src = "main = (argc, argv) ->\\n  a = `sleep 2`\\n  b = `sleep 2`\\n  p a\\n  0\\n"
+try:
+  interpreter.run(parse(indent_parse(tokenize(src))), async_io=True)
+except Exception as e:
+  print(e)
+print(threading.active_count())
+'''
+
+
+class TestAsyncIO(unittest.TestCase):
+  def test_same_output(self):
+    sequential = run(PROGRAM)
+    self.assertEqual(sequential.code, 0, sequential.err)
+    r = run(PROGRAM, "--async-io")
+    self.assertEqual((r.code, r.out), (0, sequential.out), r.err)
+
+  def test_threads_stop_on_timeout(self):
+    message, threads = python(TIMEOUT).strip().splitlines()
+    self.assertIn("timed out", message)
+    self.assertEqual(threads, "1")
+
+
+if __name__ == '__main__':
+  unittest.main()
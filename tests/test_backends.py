@@ -0,0 +1,101 @@
+"""
+Every backend, with or without -j and --async-io, should run programs
+the way the tree backend runs them.
+"""
+import unittest
+import glob
+import os
+from support import run, run_file, backends, EXAMPLES
+
+PROGRAMS = {
+  "conditions": '''
+pick = (x) -> (1 if x else "none")
+twice = (x) -> ((x if x else 0) * 2)
+main = (argc, argv) ->
+  p pick 5
+  p twice 4
+  p (pick 3) + 1
+  match
+    argc => p "args"
+  0
+''',
+  "regex groups": '''
+kind = (s) ->
+  match
+    s =~ /(?P<num>[0-9]+)/ => "number " + num
+    s =~ /(?P<id>[a-z]+)/ => "name " + id
+    _ => "other"
+main = (argc, argv) ->
+  p kind "42"
+  p kind "abc"
+  p kind "?"
+  pair = "key=1"
+  match
+    pair =~ /(?P<k>[a-z]+)=/ => p k
+  0
+''',
+  "collected streams": '''
+sq = (x) -> x * x
+main = (argc, argv) ->
+  xs = collect (map sq, (range 0, 5))
+  p xs
+  p xs[2] + 1
+  p len xs
+  t = "tail"
+  s = "{t} of "
+  p s + `echo stream`
+  0
+''',
+  "match arms of different types": '''
+f = (x) ->
+  match
+    x > 0 => x
+    _ => "neg"
+g = (x) -> (f x) + (f x)
+main = (argc, argv) ->
+  p g 1
+  p g (0 - 1)
+  0
+''',
+  "computed exit code": '''
+main = (argc, argv) -> fold ((a, v) -> a + v), 0, [1, 2, 3]
+''',
+  "exit code of unknown type": '''
+main = (argc, argv) -> (3 if argc else "x")
+''',
+  "top level": '''
+base = "x"
+a = base + `echo a`
+n = 1 + 2
+main = (argc, argv) ->
+  p a
+  p n
+  7
+''',
+}
+
+VARIANTS = [(), ("-j", "2"), ("--async-io",)]
+
+
+class TestBackends(unittest.TestCase):
+  def check(self, runner):
+    expected = runner("-b", "tree")
+    for backend in backends():
+      for flags in VARIANTS:
+        with self.subTest(backend=backend, flags=flags):
+          r = runner("-b", backend, *flags)
+          self.assertEqual((r.code, r.out), (expected.code, expected.out), r.err)
+
+  def test_examples(self):
+    for path in sorted(glob.glob(os.path.join(EXAMPLES, "*.ls"))):
+      with self.subTest(os.path.basename(path)):
+        self.check(lambda *flags: run_file(path, *flags, args=("one", "two")))
+
+  def test_programs(self):
+    for name, source in PROGRAMS.items():
+      with self.subTest(name):
+        self.check(lambda *flags: run(source, *flags))
+
+
+if __name__ == '__main__':
+  unittest.main()
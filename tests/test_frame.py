@@ -0,0 +1,55 @@
+"""
+Frames keep flattened views of their parents: lookups do not depend on
+the depth of the chain, writes never change a view another frame uses
+and snapshots do not see later assignments.
+"""
+import unittest
+from support import run, python, backends
+
+VIEWS = '''
+from frame import Frame
+top = Frame()
+top.update({"a": 1, "b": 2})
+with top as child:
+  child["b"] = 20
+  print(child["a"], child["b"], top["b"], "a" in child, "c" in child, sorted(child.keys()))
+  snap = child.snapshot()
+  child["a"] = 10
+  child["c"] = 30
+  print(snap["a"], "c" in snap, child["a"], child.get("c"), top.get("c"))
+deep = top
+for i in range(5000):  # calls look variables up at every level
+  deep = Frame(deep)
+  deep["a"]
+print(deep.depth, deep["a"], "b" in deep, len(list(deep)))
+'''
+
+CAPTURE = '''
+main = (argc, argv) ->
+  k = 1
+  addk = (x) -> x + k
+  s = map addk, (range 0, 3)
+  k = 100
+  p collect s
+  p addk 1
+  0
+'''
+
+
+class TestFrame(unittest.TestCase):
+  def test_views(self):
+    self.assertEqual(python(VIEWS).splitlines(), [
+      "1 20 2 True False ['a', 'b']",
+      "1 False 10 30 None",
+      "5000 1 True 2",
+    ])
+
+  def test_streams_capture_variables(self):
+    for backend in backends():
+      with self.subTest(backend=backend):
+        r = run(CAPTURE, "-b", backend)
+        self.assertEqual((r.code, r.out), (0, "[1, 2, 3]\n101\n"), r.err)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,78 @@
+"""
+The incremental parser reparses only top-level chunks that changed and
+should give the same tree, with the same positions, as a full parse.
+"""
+import unittest
+import subprocess
+import tempfile
+import select
+import time
+import sys
+import os
+from support import python, write, environment, ROOT, TIMEOUT
+
+EDITS = '''
+from log import logfilter
+logfilter.default = False
+from incremental import IncrementalParser
+from tokenizer import tokenize
+from indent import parse as indent_parse
+from ast import parse, walk, position
+
+def prints(tree):
+  return [position(n) for n in walk(tree) if type(n).__name__ == "Print"]
+
+sources = [
+  "inc = (x) -> x + 1\\nmain = (argc, argv) ->\\n  p inc 1\\n  0\\n",
+  # one chunk changed, the other moved down
+  "# a comment\\ninc = (x) -> x + 2\\nmain = (argc, argv) ->\\n  p inc 1\\n  0\\n",
+  "# a comment\\ninc = (x) -> x + 2\\nmain = (argc, argv) ->\\n  p inc 1\\n  0\\n",
+]
+parser = IncrementalParser()
+for source in sources:
+  tree, full = parser.parse(source), parse(indent_parse(tokenize(source)))
+  print(parser.reused, parser.reparsed, str(tree) == str(full), prints(tree) == prints(full))
+'''
+
+
+def read_until(proc, text):
+  """ Reads output of the process until it contains the text. """
+  out, deadline = b"", time.time() + TIMEOUT
+  while text.encode() not in out:
+    if not select.select([proc.stdout], [], [], deadline - time.time())[0]:
+      raise AssertionError("no %r in output:\n%s" % (text, out.decode()))
+    out += os.read(proc.stdout.fileno(), 4096)
+  return out.decode()
+
+
+class TestIncremental(unittest.TestCase):
+  def test_edits(self):
+    self.assertEqual(python(EDITS).splitlines(), [
+      "0 2 True True",
+      "1 2 True True",
+      "3 0 True True",
+    ])
+
+  def test_watch(self):
+    with tempfile.TemporaryDirectory() as tmp:
+      path = write(tmp, "watched.ls", "inc = (x) -> x + 1\nmain = (argc, argv) ->\n  p inc 1\n  0\n")
+      proc = subprocess.Popen([sys.executable, os.path.join(ROOT, "dead.py"), "-w", path],
+                              stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                              env=environment(tmp), cwd=tmp)
+      try:
+        out = read_until(proc, "waiting for changes")
+        self.assertIn("2", out.splitlines())
+        self.assertIn("0 chunks reused, 2 reparsed", out)
+        write(tmp, "watched.ls", "inc = (x) -> x + 2\nmain = (argc, argv) ->\n  p inc 1\n  0\n")
+        os.utime(path, (time.time() + 1, time.time() + 1))
+        out = read_until(proc, "waiting for changes")
+        self.assertIn("3", out.splitlines())
+        self.assertIn("1 chunks reused, 1 reparsed", out)
+      finally:
+        proc.kill()
+        proc.wait()
+        proc.stdout.close()
+
+
+if __name__ == '__main__':
+  unittest.main()
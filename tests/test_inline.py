@@ -0,0 +1,68 @@
+"""
+Inlined calls of small functions should behave as the calls do with
+--no-inline.
+"""
+import unittest
+import tempfile
+import os
+from support import run, backends
+
+PROGRAM = '''
+succ = (x) -> x + 1
+sq = (x) -> x * x
+two = (a, b) -> a * 10 + b
+k = -> 42
+main = (argc, argv) ->
+  p succ (succ 1)
+  p sq (3 + 1)
+  p two 1, 2
+  p k!
+  0
+'''
+
+UNDEFINED = '''
+const = (x) -> 42
+main = (argc, argv) ->
+  p (const undefined_name) + 1
+  0
+'''
+
+EFFECTS = '''
+const = (x) -> 42
+twice = (x) -> x + x
+main = (argc, argv) ->
+  p const (`sh -c "echo once >> %(path)s"`)
+  p twice (`sh -c "echo twice >> %(path)s"`)
+  0
+'''
+
+
+class TestInline(unittest.TestCase):
+  def same(self, source, *flags):
+    expected = run(source, "--no-inline", *flags)
+    r = run(source, *flags)
+    self.assertEqual((r.code, r.out), (expected.code, expected.out), r.err)
+    return r
+
+  def test_results(self):
+    for backend in backends():
+      with self.subTest(backend=backend):
+        r = self.same(PROGRAM, "-b", backend)
+        self.assertEqual(r.out, "3\n16\n12\n42\n")
+
+  def test_unused_arguments_are_evaluated(self):
+    for backend in backends():
+      with self.subTest(backend=backend):
+        r = self.same(UNDEFINED, "-b", backend)
+        self.assertIn("unknown variable \"undefined_name\"", r.err)
+
+  def test_shell_arguments_run_once(self):
+    with tempfile.TemporaryDirectory() as tmp:
+      path = os.path.join(tmp, "log")
+      run(EFFECTS % {"path": path})
+      with open(path) as fd:
+        self.assertEqual(fd.read(), "once\ntwice\n")
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,37 @@
+"""
+Strings from mlines and mread (MappedStr) work with operators of other
+strings on every backend.
+"""
+import unittest
+import tempfile
+from support import run, write, backends
+
+PROGRAM = '''
+isbeta = (line) -> line == "beta"
+shout = (s) -> s + "!"
+label = (s) -> "word: {s}"
+main = (argc, argv) ->
+  p collect (filter isbeta, (mlines "%(path)s"))
+  p collect (map shout, (mlines "%(path)s"))
+  p collect (map label, (mlines "%(path)s"))
+  text = mread "%(path)s"
+  p text == "alpha\\nbeta\\n"
+  p "alpha\\nbeta\\n" == text
+  0
+'''
+
+EXPECTED = "[beta]\n[alpha!, beta!]\n[word: alpha, word: beta]\nTrue\nTrue\n"
+
+
+class TestMappedStrings(unittest.TestCase):
+  def test_operators(self):
+    with tempfile.TemporaryDirectory() as tmp:
+      program = PROGRAM % {"path": write(tmp, "words.txt", "alpha\nbeta\n")}
+      for backend in backends():
+        with self.subTest(backend=backend):
+          r = run(program, "-b", backend)
+          self.assertEqual((r.code, r.out), (0, EXPECTED), r.err)
+
+
+if __name__ == '__main__':
+  unittest.main()
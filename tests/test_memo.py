@@ -0,0 +1,80 @@
+"""
+Memoized functions should give the results of the function they wrap.
+"""
+import unittest
+from support import run, backends
+
+PROGRAM = '''
+r = memo (n) -> range 0, n
+scale = memo (x) -> x * factor
+fib = memo (n) ->
+  match
+    n < 2 => n
+    _     => (fib n - 1) + (fib n - 2)
+word = memo (s) ->
+  match
+    s =~ /(?P<w>[a-z]+)!/ => w
+    _ => "none"
+twice = (n) ->
+  d = memo (x) -> x + x
+  d n
+
+main = (argc, argv) ->
+  p len (r 3)
+  p len (r 3)
+  factor = 2
+  p scale 3
+  factor = 10
+  p scale 3
+  p fib 30
+  p word "hey!"
+  p word "hey!"
+  p twice 1
+  p twice 1
+  p twice 2
+  0
+'''
+
+OUTPUT = """\
+3
+3
+6
+30
+832040
+hey
+hey
+2
+2
+4
+"""
+
+IMPURE = {
+  "io builtin": 'bad = memo (c) -> collect (pipe c)\nmain = (argc, argv) ->\n  p len (bad "ls")\n',
+  "print in a callee": 'show = (x) -> p x\nloud = memo (x) -> show x\nmain = (argc, argv) ->\n  loud 1\n',
+  "shell in a later function": 'loud = memo (x) -> later x\nlater = (x) -> `echo {x}`\nmain = (argc, argv) ->\n  p loud 1\n',
+}
+
+
+class TestMemo(unittest.TestCase):
+  def test_results(self):
+    for backend in backends():
+      with self.subTest(backend=backend):
+        r = run(PROGRAM, "-b", backend)
+        self.assertEqual((r.code, r.out), (0, OUTPUT), r.err)
+
+  def test_one_cache_per_memo(self):
+    r = run(PROGRAM, "--memo-stats")
+    stats = [l for l in r.err.splitlines() if l.startswith("#")]
+    self.assertEqual(len(stats), 5, r.err)
+    self.assertIn("1 hits, 2 misses", stats[-1])
+
+  def test_impure(self):
+    for name, source in IMPURE.items():
+      with self.subTest(name):
+        r = run(source)
+        self.assertEqual(r.code, 1)
+        self.assertIn("memoized function is not pure", r.err)
+
+
+if __name__ == '__main__':
+  unittest.main()
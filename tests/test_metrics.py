@@ -0,0 +1,54 @@
+"""
+--metrics counts calls, frames, values, shell commands and regex
+compilations of a run and writes them as JSON or Prometheus text.
+"""
+import unittest
+import tempfile
+import json
+import os
+from support import run, backends
+
+PROGRAM = '''
+sq = (x) -> x * x
+main = (argc, argv) ->
+  p sq 3
+  p sq 4
+  a = `echo hi`
+  match
+    a =~ /h(?P<r>.)/ => p r
+  0
+'''
+
+
+class TestMetrics(unittest.TestCase):
+  def test_json(self):
+    with tempfile.TemporaryDirectory() as tmp:
+      path = os.path.join(tmp, "metrics.json")
+      for backend in backends():
+        with self.subTest(backend=backend):
+          r = run(PROGRAM, "-b", backend, "--no-inline", "--metrics", path)
+          self.assertEqual((r.code, r.out), (0, "9\n16\ni\n"), r.err)
+          with open(path) as fd:
+            counters = json.load(fd)
+          self.assertEqual((counters["calls"], counters["shell_commands"],
+                            counters["regex_compilations"]), (2, 1, 1))
+          self.assertGreater(counters["shell_seconds"], 0)
+          self.assertGreater(counters["frames"], 0)
+          self.assertGreater(counters["Int"], 0)
+
+  def test_prometheus(self):
+    with tempfile.TemporaryDirectory() as tmp:
+      path = os.path.join(tmp, "metrics.txt")
+      r = run(PROGRAM, "--no-inline", "--metrics", path, "--metrics-format", "prometheus")
+      self.assertEqual(r.code, 0, r.err)
+      with open(path) as fd:
+        lines = fd.read().splitlines()
+    samples = dict(l.rsplit(" ", 1) for l in lines if not l.startswith("#"))
+    self.assertEqual(samples["deadscript_calls_total"], "2")
+    self.assertEqual(samples["deadscript_shell_commands_total"], "1")
+    self.assertIn('deadscript_values_total{type="Int"}', samples)
+    self.assertIn("# TYPE deadscript_max_depth gauge", lines)
+
+
+if __name__ == '__main__':
+  unittest.main()
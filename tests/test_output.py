@@ -0,0 +1,59 @@
+"""
+Output of programs is buffered, except when it goes to a terminal.
+"""
+import unittest
+import os
+import sys
+import time
+from support import run, python, write, ROOT
+import tempfile
+
+try:
+  import pty
+except ImportError:
+  pty = None
+
+STREAMS = '''
+import io
+import output
+class Terminal(io.StringIO):
+  def isatty(self):
+    return True
+tty, pipe = Terminal(), io.StringIO()
+for stream in (tty, pipe):
+  out = output.Output(stream)
+  out.write("line")
+  print(repr(stream.getvalue()), out.size)
+'''
+
+
+class TestOutput(unittest.TestCase):
+  def test_terminal_is_line_buffered(self):
+    tty, pipe = python(STREAMS).splitlines()
+    self.assertEqual(tty, "'line\\n' 0")
+    self.assertEqual(pipe, "'' 65536")
+
+  def test_buffered_output(self):
+    r = run("main = (argc, argv) ->\n  p \"a\"\n  p \"b\"\n  0\n")
+    self.assertEqual((r.code, r.out), (0, "a\nb\n"), r.err)
+
+  @unittest.skipIf(pty is None, "needs a pseudo-terminal")
+  def test_terminal_sees_lines_before_exit(self):
+    with tempfile.TemporaryDirectory() as tmp:
+      path = write(tmp, "slow.ls", "main = (argc, argv) ->\n  p \"first\"\n  `sleep 3`\n  0\n")
+      pid, fd = pty.fork()
+      if pid == 0:
+        os.execv(sys.executable, [sys.executable, os.path.join(ROOT, "dead.py"), path])
+      try:
+        start, data = time.time(), b""
+        while b"first" not in data and time.time() - start < 2:
+          data += os.read(fd, 1024)
+        self.assertIn(b"first", data)
+        self.assertLess(time.time() - start, 2.5)
+      finally:
+        os.waitpid(pid, 0)
+        os.close(fd)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,41 @@
+"""
+pmap maps a function in worker processes and should give what map gives.
+"""
+import unittest
+from support import run, backends
+
+PROGRAM = '''
+k = 10
+sq = (x) -> x * x
+addk = (x) -> x + k
+main = (argc, argv) ->
+  p pmap sq, [1, 2, 3, 4]
+  p (collect (pmap sq, (range 0, 100))) == (collect (map sq, (range 0, 100)))
+  p pmap addk, [1, 2]
+  p pmap ((x) -> x + 1), [1, 2]
+  0
+'''
+
+FAILING = '''
+bad = (x) -> x + y
+main = (argc, argv) ->
+  p pmap bad, [1, 2]
+  0
+'''
+
+
+class TestParallelMap(unittest.TestCase):
+  def test_same_as_map(self):
+    for backend in backends():
+      with self.subTest(backend=backend):
+        r = run(PROGRAM, "-b", backend)
+        self.assertEqual((r.code, r.out), (0, "[1, 4, 9, 16]\nTrue\n[11, 12]\n[2, 3]\n"), r.err)
+
+  def test_errors_name_the_element(self):
+    r = run(FAILING)
+    self.assertEqual(r.code, 1)
+    self.assertIn("pmap failed on element 0: unknown variable \"y\"", r.err)
+
+
+if __name__ == '__main__':
+  unittest.main()
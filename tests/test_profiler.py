@@ -0,0 +1,39 @@
+"""
+--sample writes folded stacks of deadscript functions and the lines
+they were running.
+"""
+import unittest
+import tempfile
+import os
+from support import run_file, write, backends
+
+PROGRAM = '''
+fib = (n) ->
+  match
+    n < 2 => n
+    _     => (fib n - 1) + (fib n - 2)
+main = (argc, argv) ->
+  p fib 23
+  0
+'''
+
+
+class TestProfiler(unittest.TestCase):
+  def test_folded_stacks(self):
+    with tempfile.TemporaryDirectory() as tmp:
+      path = write(tmp, "fib.ls", PROGRAM)
+      profile = os.path.join(tmp, "profile.txt")
+      for backend in backends():
+        with self.subTest(backend=backend):
+          r = run_file(path, "-b", backend, "--no-inline", "--sample", profile,
+                       "--sample-interval", "1")
+          self.assertEqual((r.code, r.out), (0, "28657\n"), r.err)
+          with open(profile) as fd:
+            stacks = [line.rsplit(" ", 1) for line in fd.read().splitlines()]
+          self.assertTrue(all(n.isdigit() for _, n in stacks), stacks)
+          prefix = "<toplevel>;main (%s:7);fib (%s:5)" % (path, path)
+          self.assertTrue(any(s.startswith(prefix) for s, _ in stacks), stacks)
+
+
+if __name__ == '__main__':
+  unittest.main()
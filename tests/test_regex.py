@@ -0,0 +1,65 @@
+"""
+Regex arms of a match are combined into one pattern and plain text
+patterns skip the regex engine. Programs should behave as they do
+with "--skip-pass regex", on strings and on mapped lines.
+"""
+import unittest
+import tempfile
+from support import run, python, write, backends
+
+PROGRAM = '''
+kind = (s) ->
+  match
+    s =~ /GET/ => "get"
+    s =~ /POST (?P<path>.*)/ => "post " + path
+    s =~ /[a-z]+/ => "word"
+    s =~ /abc\\d+/ => "never"
+    s =~ /(?P<n>\\d+) (?P<what>\\w+)/ => "{n} of {what}"
+    _ => "other"
+method = (s) ->
+  match
+    s =~ /GET/ => "get"
+    s =~ /POST/ => "post"
+    _ => "-"
+main = (argc, argv) ->
+  p collect (map kind, (lines "%(path)s"))
+  p collect (map kind, (mlines "%(path)s"))
+  p collect (map method, (mlines "%(path)s"))
+  0
+'''
+
+INPUT = "GET /index\nPOST /form\nabc123\n42 items\nDELETE x\n\n"
+
+OUTPUT = """\
+[get, post /form, word, 42 of items, other, other]
+[get, post /form, word, 42 of items, other, other]
+[get, post, -, -, -, -]
+"""
+
+PATTERNS = '''
+from log import logfilter
+logfilter.default = False
+from interpreter import literal_prefix, binary_pattern
+print([literal_prefix(p) for p in ["GET", "POST (?P<p>.*)", "(?i)abc", "a|b"]])
+print([binary_pattern(p) is None for p in ["^x", "\\\\Ax", "(?<=a)b", "\\xe9", "ab+"]])
+'''
+
+
+class TestRegex(unittest.TestCase):
+  def test_combined_arms(self):
+    with tempfile.TemporaryDirectory() as tmp:
+      program = PROGRAM % {"path": write(tmp, "requests.txt", INPUT)}
+      for backend in backends():
+        for flags in ((), ("--skip-pass", "regex")):
+          with self.subTest(backend=backend, flags=flags):
+            r = run(program, "-b", backend, *flags)
+            self.assertEqual((r.code, r.out), (0, OUTPUT), r.err)
+
+  def test_patterns(self):
+    prefixes, binary = python(PATTERNS).splitlines()
+    self.assertEqual(prefixes, "[('GET', True), ('POST ', False), ('', False), ('', False)]")
+    self.assertEqual(binary, "[True, True, True, True, False]")
+
+
+if __name__ == '__main__':
+  unittest.main()
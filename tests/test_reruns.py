@@ -0,0 +1,56 @@
+"""
+Runs of a program one after another in the same process (like
+--watch does) should not keep anything from the previous runs.
+"""
+import unittest
+from support import python
+
+PROGRAM = '''
+double = (x) -> x * 2
+half = memo (x) -> x - 21
+main = (argc, argv) ->
+  n = double (half 42)
+  assert n + 0 == 42
+  0
+'''
+
+RERUN = '''
+import sys
+from log import logfilter
+logfilter.default = False
+from tokenizer import tokenize
+from indent import parse as indent_parse
+from ast import parse
+import interpreter
+import ast
+for i in range(%d):
+  # the program is edited between runs
+  source = %r.replace("  0\\n", "  %%s - %%s\\n" %% (i, i))
+  interpreter.run(parse(indent_parse(tokenize(source))), backend=%r)
+print(%s)
+'''
+
+
+def after_runs(n, expr, backend='tree'):
+  return python(RERUN % (n, PROGRAM, backend, expr)).strip()
+
+
+class TestReruns(unittest.TestCase):
+  def assertSameAfterRuns(self, expr, backend='tree'):
+    self.assertEqual(after_runs(1, expr, backend), after_runs(3, expr, backend))
+
+  def test_inline_caches(self):
+    self.assertSameAfterRuns("len(interpreter.inline_caches)")
+
+  def test_memo_funcs(self):
+    self.assertSameAfterRuns("len(interpreter.memo_funcs)")
+
+  def test_positions(self):
+    self.assertSameAfterRuns("len(ast.positions)")
+
+  def test_compiled_code(self):
+    self.assertSameAfterRuns("len(interpreter.code_functions), len(interpreter.code_positions)", "python")
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,62 @@
+"""
+ast.rewrite is iterative: it should visit nodes in the order (and at
+the depths) the recursive version did, and trees of any depth should
+be rewritten.
+"""
+import unittest
+import os
+from support import python, EXAMPLES
+
+REWRITE = '''
+from log import logfilter
+logfilter.default = False
+from tokenizer import tokenize
+from indent import parse as indent_parse
+from ast import parse, rewrite, visits, walk, Node, Block, Add, Parens, Int, Id
+
+def recursive(tree, f, d=0):
+  """ The recursive version rewrite replaced. """
+  if d == 0: tree = f(tree, d)
+  for i, n in enumerate(tree):
+    if isinstance(n, Node):
+      n = recursive(n, f, d+1)
+    tree[i] = f(n, d)
+  return tree
+
+calls = []
+def record(node, depth):
+  calls.append((type(node).__name__, depth))
+  return node
+
+with open(%r) as fd:
+  tree = parse(indent_parse(tokenize(fd.read())))
+recursive(tree, record)
+expected = calls[:]
+del calls[:]
+rewrite(tree, record)
+print(calls == expected, len(calls) > 100)
+
+del calls[:]
+rewrite(Block(Add(Int(1), Parens(Id("x"))), Int(2)), visits(Int, skip=(Parens,))(record))
+print(calls)
+
+@visits(Int)
+def add_depth(node, depth):
+  return Int(node.value + depth)
+deep = Int(0)
+for i in range(50000):
+  deep = Parens(deep)
+print([n for n in walk(rewrite(deep, add_depth)) if isinstance(n, Int)])
+''' % os.path.join(EXAMPLES, "basic.ls")
+
+
+class TestRewrite(unittest.TestCase):
+  def test_rewrite(self):
+    same, filtered, deep = python(REWRITE).splitlines()
+    self.assertEqual(same, "True True")
+    self.assertEqual(filtered, "[('Int', 1), ('Int', 0)]")
+    self.assertEqual(deep, "[Int(49999)]")
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,28 @@
+"""
+Guards startup time (everything before a program is executed, see
+--budget). The budget is generous to keep slow machines from failing,
+STARTUP_BUDGET (in milliseconds) overrides it.
+"""
+import unittest
+import glob
+import os
+from support import run_file, EXAMPLES
+
+BUDGET = float(os.environ.get("STARTUP_BUDGET", 150))
+
+
+class TestStartup(unittest.TestCase):
+  def test_budget(self):
+    for path in sorted(glob.glob(os.path.join(EXAMPLES, "*.ls"))):
+      with self.subTest(os.path.basename(path)):
+        r = run_file(path, "-n", "--budget", str(BUDGET))
+        self.assertEqual(r.code, 0, r.err)
+
+  def test_budget_fails(self):
+    r = run_file(os.path.join(EXAMPLES, "hello.ls"), "-n", "--budget", "0.001")
+    self.assertEqual(r.code, 1)
+    self.assertIn("startup took", r.err)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,46 @@
+"""
+Streams produce elements on demand, so pipelines over endless or huge
+inputs finish as soon as they have what they need.
+"""
+import unittest
+import os
+from support import run, backends, EXAMPLES
+
+PROGRAM = '''
+sq = (x) -> x * x
+big = (x) -> x > 20
+head = (s) -> collect (take 3, s)
+main = (argc, argv) ->
+  p head (range 0, 1000000000000)
+  p head (pipe "yes")
+  p collect (filter big, (map sq, (range 0, 10)))
+  p len (range 0, 100)
+  p fold ((a, v) -> a + v), 0, (range 1, 101)
+  p (range 0, 5) $ head
+  p head . (range 10, 20)
+  p take 1, (lines "%s")
+  0
+''' % os.path.join(EXAMPLES, "hello.ls")
+
+OUTPUT = """\
+[0, 1, 2]
+[y, y, y]
+[25, 36, 49, 64, 81]
+100
+5050
+[0, 1, 2]
+[10, 11, 12]
+main = (argc, argv) -> p "Hello, my arguments are {argv}"
+"""
+
+
+class TestStreams(unittest.TestCase):
+  def test_pipelines(self):
+    for backend in backends():
+      with self.subTest(backend=backend):
+        r = run(PROGRAM, "-b", backend)
+        self.assertEqual((r.code, r.out), (0, OUTPUT), r.err)
+
+
+if __name__ == '__main__':
+  unittest.main()
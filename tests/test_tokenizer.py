@@ -0,0 +1,71 @@
+"""
+Tokens are kept in array columns (kind, start, end, line) and turned
+into objects only when they are accessed. The tokenizer dispatches on
+the first character of a token and should split lines as the PEG
+grammar (tokenizer.PROGRAM) does.
+"""
+import unittest
+import glob
+import os
+from support import python, EXAMPLES
+
+SOURCE = 'x = 1\nmain = (argc, argv) ->\n  p "hi {x}"\n'
+
+COLUMNS = '''
+from log import logfilter
+logfilter.default = False
+from tokenizer import tokenize
+from ast import symap
+t = tokenize(%r)
+print(len(t), "".join(c.typecode for c in (t.kind, t.start, t.end, t.line)))
+print(list(t))
+print([t.position(i) for i in range(len(t)) if not t.is_dent(i)])
+print([t.indent(i) for i in range(len(t)) if t.is_dent(i)])
+print(t[2] is symap["="], t.symbol(2), t.symbol(1))
+''' % SOURCE
+
+LINES = [
+  "matches = iffy + px", "p x", "memo x", "x = 1.5 + 42", "a=~/[a-z]+/ # note",
+  "f . g $ h", 's = "a {b}"', "c = `ls -l`", "x /* c */ + y // rest",
+  "elsewhere = 3 if a else b", "_ => assert x", "return", "r = [1, 2][0]",
+  "x->y", "a == b",
+]
+
+SAME_AS_GRAMMAR = '''
+from log import logfilter
+logfilter.default = False
+from tokenizer import tokenize, PROGRAM
+for line in %r:
+  fast, grammar = repr(list(tokenize(line))[1:]), repr(PROGRAM.parse(line)[0])
+  if fast != grammar:
+    print(line, fast, grammar)
+try:
+  tokenize("x = 1 ? 2")
+except Exception as e:
+  print(e)
+'''
+
+
+class TestTokens(unittest.TestCase):
+  def test_columns(self):
+    size, tokens, positions, dents, symbol = python(COLUMNS).splitlines()
+    self.assertEqual(size, "16 HIII")
+    self.assertEqual(tokens, "[DENT:0, Id(x), Sym('='), Int(1), DENT:0, Id(main), Sym('='), "
+                     "Sym('('), Id(argc), Sym(','), Id(argv), Sym(')'), Sym('->'), "
+                     "DENT:2, Sym('p '), Str(hi {x})]")
+    self.assertEqual(positions, "[(1, 1), (1, 3), (1, 5), (2, 1), (2, 6), (2, 8), (2, 9), "
+                     "(2, 13), (2, 15), (2, 19), (2, 21), (3, 3), (3, 5)]")
+    self.assertEqual(dents, "[0, 0, 2]")
+    self.assertEqual(symbol, "True = None")
+
+  def test_same_as_grammar(self):
+    lines = LINES[:]
+    for path in sorted(glob.glob(os.path.join(EXAMPLES, "*.ls"))):
+      with open(path) as fd:
+        lines += [l for l in fd.read().splitlines() if l.strip()]
+    out = python(SAME_AS_GRAMMAR % lines)
+    self.assertTrue(out.startswith("Cannot parse line 1:"), out)
+
+
+if __name__ == '__main__':
+  unittest.main()
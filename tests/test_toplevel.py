@@ -0,0 +1,98 @@
+"""
+With -j, top-level assignments that wait for I/O run in threads. The
+output should be the same as when they run one after another.
+"""
+import unittest
+from support import run, python
+
+PROGRAM = '''
+base = "x"
+a = base + `echo a`
+b = base + `echo b`
+c = (base + `echo c`) + "!"
+n = 1 + 2
+inc = (x) -> x + 1
+d = inc n
+main = (argc, argv) ->
+  p a
+  p b
+  p c
+  p d
+  0
+'''
+
+GROUPS = '''
+x = `sh -c "sleep 0.3; echo 5"` =~ /(?P<num>[0-9]+)/
+y = num
+main = (argc, argv) ->
+  p y
+  0
+'''
+
+THREADED_ADDS = '''
+import sys
+import threading
+from log import logfilter
+logfilter.default = False
+from interpreter import Str
+sys.setswitchinterval(1e-6)
+wrong = []
+def work(shared, i):
+  for j in range(200):
+    suffix = "%s.%s" % (i, j)
+    if j % 3 == 0:
+      shared.value  # joins the parts
+    s = shared.Add(Str(suffix))
+    if s.value != "abc" + suffix:
+      wrong.append(s.value)
+for _ in range(20):
+  shared = Str("a").Add(Str("b")).Add(Str("c"))
+  threads = [threading.Thread(target=work, args=(shared, i)) for i in range(4)]
+  for t in threads: t.start()
+  for t in threads: t.join()
+print(len(wrong))
+'''
+
+SHARED_PARTS = '''
+from log import logfilter
+logfilter.default = False
+from interpreter import Str
+shared = Str("x").Add(Str("y"))
+class Racing(Str):
+  """ Another thread adds to the shared string while this one is read. """
+  raced = False
+  @property
+  def value(self):
+    if not self.raced:
+      self.raced = True
+      shared.Add(Str("other"))
+    return "mine"
+  @value.setter
+  def value(self, value):
+    pass
+print(shared.Add(Racing(None)).value)
+'''
+
+
+class TestJobs(unittest.TestCase):
+  def test_same_output(self):
+    sequential = run(PROGRAM)
+    self.assertEqual(sequential.code, 0, sequential.err)
+    for jobs in ("2", "4"):
+      with self.subTest(jobs=jobs):
+        r = run(PROGRAM, "-j", jobs)
+        self.assertEqual((r.code, r.out), (0, sequential.out), r.err)
+
+  def test_regex_groups(self):
+    r = run(GROUPS, "-j", "2")
+    self.assertEqual((r.code, r.out), (0, "5\n"), r.err)
+
+  def test_threaded_adds(self):
+    self.assertEqual(python(THREADED_ADDS).strip(), "0")
+
+  def test_shared_string_parts(self):
+    self.assertEqual(python(SHARED_PARTS).strip(), "xymine")
+
+
+if __name__ == '__main__':
+  unittest.main()
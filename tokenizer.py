@@ -1,14 +1,24 @@
-from peg import RE, SOMEOF, OR, SYMBOL, NoMatch
+from peg import RE, SOMEOF, NoMatch
 from ast import symap, Id, Int, Str, ShellCmd, RegEx, Comment
 from log import Log
+from array import array
+import re
 
 log = Log("tokenizer")
 
+ESCAPES = {'n': '\n', 't': '\t'}
+
+def unescape(cls):
+  """ Strings are decoded once, here, not every time they are used. """
+  escape = re.compile(r'\\([%s])' % "".join(ESCAPES))
+  return lambda text: cls(escape.sub(lambda m: ESCAPES[m.group(1)], text))
+
+
 # CONSTANTS
 FLOATCONST = RE(r'\d+\.\d*')
 INTCONST   = RE(r'\d+', Int)
-STRCONST   = RE(r'"(.*)"', Str)
-SHELLCMD   = RE(r'`(.*)`', ShellCmd)
+STRCONST   = RE(r'"(.*)"', unescape(Str))
+SHELLCMD   = RE(r'`(.*)`', unescape(ShellCmd))
 REGEX      = RE(r'/(.*)/', RegEx)
 CONST = FLOATCONST | INTCONST | STRCONST | SHELLCMD | REGEX
 
@@ -28,10 +38,8 @@ END = EOL | (COMMENT+EOL)
 ID = RE(r'[A-Za-z_][a-zA-Z0-9_]*', Id)
 
 # put longest operators first because for PEG first match wins
-operators = []
-for sym in sorted(symap.keys(), key=len, reverse=True):
-  operators += [SYMBOL(sym, symap[sym])]
-OPERATOR = OR(*operators)
+symbols = tuple(sorted(symap.keys(), key=len, reverse=True))
+OPERATOR = RE("|".join(re.escape(sym) for sym in symbols), symap.__getitem__)
 PROGRAM = SOMEOF(COMMENT, CONST, OPERATOR, ID) #+ END
 
 
@@ -43,32 +51,164 @@ class DENT:
     return "DENT:%s" % self.value
 
 
-def get_indent(s):
-  """Get current indent in symbols""" #TODO: Check that indent is in spaces, not tabs
-  depth = 0
-  for depth, c in enumerate(s):
-    if not c.isspace():
-      break
-  return depth
+# Token kinds. Kind of a rule is its position in RULES plus one
+# (in the same order as in PROGRAM because the first match wins),
+# operators are numbered after them in the order of symbols.
+DENT_KIND = 0
+RULES = (SHELLCOMMENT, CCOMMENT, CPPCOMMENT, FLOATCONST, INTCONST,
+         STRCONST, SHELLCMD, REGEX, OPERATOR, ID)
+OPERATOR_KIND = RULES.index(OPERATOR) + 1
+SYMBOL_KIND = len(RULES) + 1
+symkinds = {sym: SYMBOL_KIND+i for i, sym in enumerate(symbols)}
+
+# Dispatch on the first character of a token (after whitespace): it
+# decides which rules can match, so most tokens are scanned without
+# trying the rules before them. Words are scanned once and checked
+# against keywords (operators that start with a letter, they win over
+# identifiers like in PROGRAM), numbers are scanned once for both kinds
+# of constants. Other characters try only the rules that can start
+# with them, in the same order, and unknown ones try all rules.
+SPACE  = re.compile(r'\s*')
+WORD   = re.compile(r'[A-Za-z_][a-zA-Z0-9_]*')
+NUMBER = re.compile(r'\d+(\.\d*)?')
+WORD_START = frozenset("ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz_")
+DIGITS = frozenset("0123456789")
+ID_KIND = RULES.index(ID) + 1
+INT_KIND = RULES.index(INTCONST) + 1
+FLOAT_KIND = RULES.index(FLOATCONST) + 1
+ALL_RULES = tuple(enumerate(RULES, 1))
+
+keywords = {}    # first letter -> ((keyword, kind), ...) in order of symbols
+candidates = {}  # first character -> ((kind, rule), ...) in order of RULES
+for c, rules in (('#', (SHELLCOMMENT,)), ('/', (CCOMMENT, CPPCOMMENT, REGEX)),
+                 ('"', (STRCONST,)), ('`', (SHELLCMD,))):
+  candidates[c] = tuple((RULES.index(rule)+1, rule) for rule in rules)
+for sym in symbols:
+  c = sym[0]
+  if c in WORD_START:
+    keywords[c] = keywords.get(c, ()) + ((sym, symkinds[sym]),)
+  elif not c.isspace() and (OPERATOR_KIND, OPERATOR) not in candidates.get(c, ()):
+    candidates[c] = candidates.get(c, ()) + ((OPERATOR_KIND, OPERATOR),)
+
+
+class Tokens:
+  """ Token stream stored in parallel arrays: kind, start and end
+      offsets in the source and the line number. Token objects
+      are created only when they are accessed. Dents span the
+      indentation of the line, so their length is the level.
+  """
+  def __init__(self, raw):
+    self.raw = raw
+    self.kind = array('H')
+    self.start = array('I')
+    self.end = array('I')
+    self.line = array('I')
+
+  def append(self, kind, start, end, line):
+    self.kind.append(kind)
+    self.start.append(start)
+    self.end.append(end)
+    self.line.append(line)
+
+  def extend(self, other, offset, line):
+    """ Appends tokens of a line tokenized separately. """
+    self.kind.extend(other.kind)
+    self.start.extend(s+offset for s in other.start)
+    self.end.extend(e+offset for e in other.end)
+    self.line.extend(line for _ in other.kind)
+
+  def __len__(self):
+    return len(self.kind)
+
+  def __getitem__(self, i):
+    kind, start, end = self.kind[i], self.start[i], self.end[i]
+    if kind == DENT_KIND:
+      return DENT(end-start)
+    if kind >= SYMBOL_KIND:
+      return symap[symbols[kind-SYMBOL_KIND]]
+    rule = RULES[kind-1]
+    m = rule.pattern.match(self.raw, start, end)
+    return rule.token(m.group(rule.pattern.groups))
+
+  def __iter__(self):
+    return map(self.__getitem__, range(len(self)))
+
+  def is_dent(self, i):
+    return self.kind[i] == DENT_KIND
+
+  def indent(self, i):
+    return self.end[i] - self.start[i]
+
+  def symbol(self, i):
+    """ Returns the operator or None for other tokens. """
+    kind = self.kind[i]
+    return symbols[kind-SYMBOL_KIND] if kind >= SYMBOL_KIND else None
+
+  def position(self, i):
+    """ Returns line and column of a token (both from 1). """
+    start = self.start[i]
+    return self.line[i], start - self.raw.rfind("\n", 0, start)
+
+  def __repr__(self):
+    return repr(list(self))
+
+
+def tokenize_line(tokens, raw, pos, end, i):
+  """ Tokenizes a single non-empty line spanning raw[pos:end]
+      into tokens, i is its number (used in error messages).
+  """
+  lstart = pos
+  while pos < end and raw[pos].isspace():
+    pos += 1
+  tokens.append(DENT_KIND, lstart, pos, i)
+  pos, count = lstart, len(tokens)
+  space, word, number = SPACE.match, WORD.match, NUMBER.match
+  while pos < end:
+    start = space(raw, pos, end).end()
+    c = raw[start:start+1]
+    if c in WORD_START:
+      for sym, kind in keywords.get(c, ()):
+        if raw.startswith(sym, start, end):
+          stop = start + len(sym)
+          break
+      else:
+        kind, stop = ID_KIND, word(raw, start, end).end()
+    elif c in DIGITS:
+      m = number(raw, start, end)
+      kind, stop = INT_KIND if m.group(1) is None else FLOAT_KIND, m.end()
+    else:
+      for kind, rule in candidates.get(c, ALL_RULES):
+        m = rule.pattern.match(raw, pos, end)
+        if m:
+          break
+      else:
+        break
+      if kind == OPERATOR_KIND:
+        kind = symkinds[m.group(1)]
+      start, stop = m.start(1), m.end(1)
+    tokens.append(kind, start, stop, i)
+    pos = stop
+  l = raw[lstart:end]
+  if len(tokens) == count:
+    raise Exception("cannot parse string:\n%s"%l)
+  if pos != end:
+    pos -= lstart
+    if pos > 5: ptr = "here {}┘".format("─"*(pos-4))
+    else:       ptr = " "*(pos+1) + "└─── error is somewhere here"
+    msg = "{msg}:\n\"{text}\"\n{ptr}\n" \
+          .format(msg="Cannot parse line %s"%i, text=l, ptr=ptr)
+    raise Exception(msg)
+  return tokens
 
 
 def tokenize(raw):
-  tokens = []
-  for i,l in enumerate(raw.splitlines(), 1):
-    if not l:
-      continue
-    tokens += [DENT(get_indent(l))]
-    try:
-      ts, pos = PROGRAM.parse(l)
-    except NoMatch:
-      raise Exception("cannot parse string:\n%s"%l)
-    if len(l) != pos:
-      if pos > 5: ptr = "here {}┘".format("─"*(pos-4))
-      else:       ptr = " "*(pos+1) + "└─── error is somewhere here"
-      msg = "{msg}:\n\"{text}\"\n{ptr}\n" \
-            .format(msg="Cannot parse line %s"%i, text=l, ptr=ptr)
-      raise Exception(msg)
-    tokens += ts
+  tokens = Tokens(raw)
+  pos = 0
+  for i,l in enumerate(raw.splitlines(True), 1):
+    line = l.splitlines()[0]
+    if line:
+      tokenize_line(tokens, raw, pos, pos+len(line), i)
+    pos += len(l)
 
   log("after tokenizer:\n", tokens)
-  return tokens
\ No newline at end of file
+  return tokens